@@ -0,0 +1,49 @@
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine, pool
+from database import Base, DATABASE_URL
+import models  # noqa: F401 (registra todas las tablas en Base.metadata)
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+# Los modelos son la fuente del esquema: autogenerate compara contra ellos
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url") or DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # migrate.py y los tests pueden pasar una conexión ya abierta
+    connection = config.attributes.get("connection")
+    if connection is None:
+        url = config.get_main_option("sqlalchemy.url") or DATABASE_URL
+        with create_engine(url, poolclass=pool.NullPool).connect() as connection:
+            run_with(connection)
+    else:
+        run_with(connection)
+
+
+def run_with(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        compare_type=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,177 @@
+"""esquema inicial
+
+El esquema tal como lo creaba database/schema.sql, con sus datos de prueba.
+Las bases creadas con ese script se marcan en esta revisión (migrate.py) y
+continúan desde aquí.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+SEED_PRODUCTS = [
+    ("Laptop HP Pavilion", "Laptop de 15 pulgadas con procesador Intel Core i5", 1299.99, 10),
+    ("Mouse Inalámbrico", "Mouse ergonómico inalámbrico con receptor USB", 29.99, 50),
+    ("Teclado Mecánico", "Teclado RGB mecánico con switches azules", 89.99, 25),
+    ('Monitor 24"', "Monitor Full HD de 24 pulgadas", 199.99, 15),
+    ("Auriculares Bluetooth", "Auriculares con cancelación de ruido", 149.99, 30),
+    ("Webcam HD", "Cámara web 1080p con micrófono integrado", 59.99, 40),
+    ("Disco SSD 500GB", "Disco sólido interno de 500GB", 79.99, 20),
+    ("USB Flash 64GB", "Memoria USB 3.0 de 64GB", 12.99, 100),
+]
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(100), nullable=False, unique=True),
+        sa.Column("email", sa.String(255), nullable=False, unique=True),
+        sa.Column("password_hash", sa.String(255), nullable=False),
+        sa.Column("is_active", sa.Boolean(), server_default=sa.true()),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+
+    products = op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("sku", sa.String(64)),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("price", sa.Numeric(10, 2), nullable=False),
+        sa.Column("stock", sa.Integer(), server_default="0"),
+        sa.Column("image_url", sa.String(500)),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('spanish', coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+        ),
+        sa.UniqueConstraint("sku", name="uq_products_sku"),
+        sa.CheckConstraint("stock >= 0", name="ck_products_stock_nonnegative"),
+    )
+
+    op.create_table(
+        "carts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE")),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint("user_id", name="uq_carts_user_id"),
+    )
+
+    op.create_table(
+        "cart_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("cart_id", sa.Integer(), sa.ForeignKey("carts.id", ondelete="CASCADE")),
+        sa.Column(
+            "product_id", sa.Integer(), sa.ForeignKey("products.id", ondelete="CASCADE")
+        ),
+        sa.Column("quantity", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("added_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint("cart_id", "product_id", name="uq_cart_items_cart_product"),
+    )
+
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("total", sa.Numeric(12, 2), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+
+    op.create_table(
+        "order_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "order_id",
+            sa.Integer(),
+            sa.ForeignKey("orders.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "product_id",
+            sa.Integer(),
+            sa.ForeignKey("products.id", ondelete="RESTRICT"),
+            nullable=False,
+        ),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("unit_price", sa.Numeric(10, 2), nullable=False),
+    )
+
+    op.create_index("idx_users_email", "users", ["email"])
+    op.create_index("idx_users_username", "users", ["username"])
+    op.create_index("idx_products_name", "products", ["name"])
+    op.create_index("idx_products_created_at_id", "products", ["created_at", "id"])
+    op.create_index("idx_products_price_id", "products", ["price", "id"])
+    op.create_index("idx_products_name_id", "products", ["name", "id"])
+    op.execute(
+        "CREATE INDEX idx_products_name_prefix ON products (lower(name) text_pattern_ops)"
+    )
+    op.create_index(
+        "idx_products_in_stock",
+        "products",
+        ["created_at", "id"],
+        postgresql_where=sa.text("stock > 0"),
+    )
+    op.create_index(
+        "idx_products_search", "products", ["search_vector"], postgresql_using="gin"
+    )
+    op.create_index(
+        "idx_products_name_trgm",
+        "products",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index("idx_cart_items_product_id", "cart_items", ["product_id"])
+    op.create_index("idx_carts_updated_at", "carts", ["updated_at"])
+    op.create_index("idx_orders_user_id_id", "orders", ["user_id", "id"])
+    op.create_index(
+        "idx_orders_pending_expires",
+        "orders",
+        ["expires_at"],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    op.create_index("idx_order_items_order_id", "order_items", ["order_id"])
+
+    # Datos de prueba
+    op.bulk_insert(
+        products,
+        [
+            {
+                "name": name,
+                "description": description,
+                "price": price,
+                "stock": stock,
+                "image_url": "https://via.placeholder.com/300",
+            }
+            for name, description, price, stock in SEED_PRODUCTS
+        ],
+    )
+
+
+def downgrade():
+    for table in ["order_items", "orders", "cart_items", "carts", "products", "users"]:
+        op.drop_table(table)
@@ -0,0 +1,78 @@
+"""alinear el esquema con los modelos
+
+- Fechas con zona horaria en users, products, carts y cart_items, como
+  declaran los modelos (orders ya las tenía).
+- NOT NULL en carts.user_id, cart_items.cart_id y cart_items.product_id;
+  las filas huérfanas que la API nunca crea se eliminan antes.
+- Fuera los índices redundantes: las restricciones UNIQUE de users ya
+  indexan username y email, e idx_products_name_id cubre a idx_products_name.
+- Índice en order_items(product_id) para el ON DELETE RESTRICT al borrar
+  productos.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+TIMESTAMPS = [
+    ("users", "created_at"),
+    ("products", "created_at"),
+    ("carts", "created_at"),
+    ("carts", "updated_at"),
+    ("cart_items", "added_at"),
+]
+
+
+def upgrade():
+    # La API escribía las fechas con now() en la zona del servidor (UTC en
+    # la imagen de Postgres). Con UTC la conversión no reescribe las tablas
+    op.execute("SET LOCAL timezone = 'UTC'")
+    for table, column in TIMESTAMPS:
+        op.alter_column(
+            table,
+            column,
+            type_=sa.DateTime(timezone=True),
+            existing_type=sa.DateTime(),
+            existing_server_default=sa.func.now(),
+        )
+
+    op.execute("DELETE FROM carts WHERE user_id IS NULL")
+    op.execute("DELETE FROM cart_items WHERE cart_id IS NULL OR product_id IS NULL")
+    op.alter_column("carts", "user_id", existing_type=sa.Integer(), nullable=False)
+    op.alter_column("cart_items", "cart_id", existing_type=sa.Integer(), nullable=False)
+    op.alter_column(
+        "cart_items", "product_id", existing_type=sa.Integer(), nullable=False
+    )
+
+    op.drop_index("idx_users_email", table_name="users")
+    op.drop_index("idx_users_username", table_name="users")
+    op.drop_index("idx_products_name", table_name="products")
+    op.create_index("idx_order_items_product_id", "order_items", ["product_id"])
+
+
+def downgrade():
+    op.drop_index("idx_order_items_product_id", table_name="order_items")
+    op.create_index("idx_products_name", "products", ["name"])
+    op.create_index("idx_users_username", "users", ["username"])
+    op.create_index("idx_users_email", "users", ["email"])
+
+    op.alter_column("cart_items", "product_id", existing_type=sa.Integer(), nullable=True)
+    op.alter_column("cart_items", "cart_id", existing_type=sa.Integer(), nullable=True)
+    op.alter_column("carts", "user_id", existing_type=sa.Integer(), nullable=True)
+
+    op.execute("SET LOCAL timezone = 'UTC'")
+    for table, column in TIMESTAMPS:
+        op.alter_column(
+            table,
+            column,
+            type_=sa.DateTime(),
+            existing_type=sa.DateTime(timezone=True),
+            existing_server_default=sa.func.now(),
+        )
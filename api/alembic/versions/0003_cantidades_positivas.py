@@ -0,0 +1,35 @@
+"""cantidades positivas en carritos y pedidos
+
+CHECK (quantity > 0) en cart_items y order_items: una cantidad negativa en
+el carrito llegaba al checkout como un pedido con total negativo que sumaba
+stock al reservarlo. Los items de carrito con cantidad no positiva se
+eliminan antes; los de pedidos no se tocan, si existen la migración falla
+para revisarlos a mano.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("DELETE FROM cart_items WHERE quantity <= 0")
+    op.create_check_constraint(
+        "ck_cart_items_quantity_positive", "cart_items", "quantity > 0"
+    )
+    op.create_check_constraint(
+        "ck_order_items_quantity_positive", "order_items", "quantity > 0"
+    )
+
+
+def downgrade():
+    op.drop_constraint(
+        "ck_order_items_quantity_positive", "order_items", type_="check"
+    )
+    op.drop_constraint("ck_cart_items_quantity_positive", "cart_items", type_="check")
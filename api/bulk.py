@@ -0,0 +1,359 @@
+from fastapi import HTTPException, status
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from sqlalchemy import any_, bindparam, func, literal_column, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from decimal import Decimal
+from datetime import datetime
+import codecs
+import csv
+import io
+import json
+import os
+from database import run_db
+from cache import invalidate_catalog, notify_catalog_change
+import edge_cache
+from models.product import Product
+from reservations import reserved_stock
+
+# Filas por sentencia INSERT ... ON CONFLICT (y por transacción)
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+# Errores por fila incluidos en la respuesta; el total se cuenta igual
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "100"))
+# Filas por lote leídas del cursor del servidor al exportar
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+IMPORT_FIELDS = ["sku", "name", "description", "price", "stock", "image_url"]
+EXPORT_FIELDS = ["id", *IMPORT_FIELDS, "created_at"]
+REQUIRED_FIELDS = {"sku", "name", "price"}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+REQUEST_FORMATS = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+class ProductImport(BaseModel):
+    sku: str = Field(..., min_length=1, max_length=64)
+    name: str = Field(..., min_length=1, max_length=255)
+    description: Optional[str] = None
+    price: Decimal = Field(..., ge=0, max_digits=10, decimal_places=2)
+    stock: int = Field(0, ge=0, le=2147483647)
+    image_url: Optional[str] = Field(None, max_length=500)
+
+    @field_validator("sku", "name", "description", "image_url")
+    @classmethod
+    def reject_nul(cls, value):
+        # Postgres no admite el carácter NUL en columnas de texto
+        if value is not None and "\x00" in value:
+            raise ValueError("contiene el carácter NUL")
+        return value
+
+
+class ImportReport:
+    """Totales de la importación y detalle de las filas rechazadas"""
+
+    def __init__(self):
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line: int, sku: Optional[str], message: str):
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"line": line, "sku": sku, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+def request_format(content_type: str) -> Optional[str]:
+    return REQUEST_FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+async def iter_lines(chunks):
+    """Líneas numeradas del cuerpo a medida que llega, sin leerlo completo"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    number = 0
+    try:
+        async for chunk in chunks:
+            buffer += decoder.decode(chunk)
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                number += 1
+                yield number, line.rstrip("\r")
+        buffer += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El archivo no es UTF-8 válido (cerca de la línea {number + 1})",
+        )
+    if buffer.strip():
+        yield number + 1, buffer.rstrip("\r")
+
+
+async def iter_ndjson(lines):
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, "JSON inválido"
+            continue
+        yield number, record if isinstance(record, dict) else "Se esperaba un objeto"
+
+
+async def iter_csv(lines):
+    header = None
+    pending, start = "", 0
+    async for number, line in lines:
+        # Un campo entre comillas puede contener saltos de línea: se acumulan
+        # líneas hasta que las comillas queden balanceadas
+        if not pending:
+            start = number
+        pending += line + "\n"
+        if pending.count('"') % 2:
+            continue
+
+        values = next(csv.reader(io.StringIO(pending)), [])
+        pending = ""
+        if not any(value.strip() for value in values):
+            continue
+
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            missing = sorted(REQUIRED_FIELDS - set(header))
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Faltan columnas en el CSV: {', '.join(missing)}",
+                )
+            continue
+
+        if len(values) != len(header):
+            yield start, f"Se esperaban {len(header)} columnas y hay {len(values)}"
+            continue
+
+        # Las celdas vacías se toman como ausentes (valor por defecto)
+        yield start, {
+            field: value for field, value in zip(header, values) if value != ""
+        }
+
+    if pending:
+        yield start, "Comillas sin cerrar"
+
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+def build_upsert():
+    """INSERT ... SELECT FROM unnest(arreglos) con upsert por SKU.
+
+    Cada columna viaja como un arreglo, así la sentencia es siempre la misma
+    (se compila y prepara una vez) sin importar el tamaño del lote.
+    """
+    columns = Product.__table__.c
+    rows = (
+        func.unnest(
+            *[bindparam(field, type_=ARRAY(columns[field].type)) for field in IMPORT_FIELDS]
+        )
+        .table_valued(*IMPORT_FIELDS)
+        .render_derived()
+    )
+    stmt = insert(Product.__table__).from_select(
+        IMPORT_FIELDS, select(*[rows.c[field] for field in IMPORT_FIELDS])
+    )
+    updated_fields = [field for field in IMPORT_FIELDS if field != "sku"]
+    return stmt.on_conflict_do_update(
+        constraint="uq_products_sku",
+        set_={field: stmt.excluded[field] for field in updated_fields},
+        # Las filas idénticas no se reescriben (ni se regenera search_vector)
+        where=tuple_(*[columns[field] for field in updated_fields]).is_distinct_from(
+            tuple_(*[stmt.excluded[field] for field in updated_fields])
+        ),
+    ).returning(literal_column("xmax = 0"))
+
+
+UPSERT_PRODUCTS = build_upsert()
+
+# Bloquea los productos existentes del lote en orden de id, como las reservas
+LOCK_PRODUCTS = (
+    select(Product.id, Product.sku)
+    .where(Product.sku == any_(bindparam("sku", type_=ARRAY(Product.sku.type))))
+    .order_by(Product.id)
+    .with_for_update(key_share=True)
+)
+
+
+def upsert_products(db: Session, items: List[ProductImport]):
+    """Escribe el lote y devuelve (insertados, actualizados, rechazados).
+
+    El stock importado es la existencia física: a los productos existentes se
+    les resta lo reservado en pedidos pendientes, que vuelve al stock al
+    liberarse. Los que tienen menos existencia que reservas no se escriben y
+    se devuelven como {sku: unidades reservadas}.
+    """
+    # Con las filas bloqueadas, ninguna reserva sobre ellas cambia hasta el commit
+    existing = dict(
+        db.execute(LOCK_PRODUCTS, {"sku": [item.sku for item in items]}).all()
+    )
+    reserved = {
+        existing[product_id]: quantity
+        for product_id, quantity in reserved_stock(db, list(existing)).items()
+    }
+    rejected = {
+        item.sku: reserved[item.sku]
+        for item in items
+        if item.stock < reserved.get(item.sku, 0)
+    }
+    items = [item for item in items if item.sku not in rejected]
+    if not items:
+        return 0, 0, rejected
+
+    params = {
+        field: [getattr(item, field) for item in items] for field in IMPORT_FIELDS
+    }
+    params["stock"] = [item.stock - reserved.get(item.sku, 0) for item in items]
+    inserted_flags = db.execute(UPSERT_PRODUCTS, params).scalars().all()
+    inserted = sum(1 for flag in inserted_flags if flag)
+    return inserted, len(inserted_flags) - inserted, rejected
+
+
+def database_message(error: DBAPIError) -> str:
+    # asyncpg llega envuelto por el adaptador de SQLAlchemy: usar su causa
+    original = error.orig.__cause__ or error.orig
+    return str(original).splitlines()[0]
+
+
+def load_batch(db: Session, batch: List[tuple], report: ImportReport):
+    # Un SKU repetido dentro del lote no puede actualizarse dos veces en la
+    # misma sentencia: se conserva su última aparición
+    latest = {item.sku: (line, item) for line, item in batch}
+    entries = sorted(latest.values(), key=lambda entry: entry[0])
+    report.duplicates += len(batch) - len(entries)
+
+    try:
+        inserted, updated, rejected = upsert_products(db, [item for _, item in entries])
+        notify_catalog_change(db)
+        db.commit()
+        report_rejected(report, entries, rejected)
+        report.inserted += inserted
+        report.updated += updated
+        report.unchanged += len(entries) - inserted - updated - len(rejected)
+        return
+    except DBAPIError:
+        db.rollback()
+
+    # El lote falló en la base: reintentar fila por fila para aislar el error
+    for line, item in entries:
+        try:
+            inserted, updated, rejected = upsert_products(db, [item])
+            notify_catalog_change(db)
+            db.commit()
+        except DBAPIError as e:
+            db.rollback()
+            report.add_error(line, item.sku, database_message(e))
+            continue
+        report_rejected(report, [(line, item)], rejected)
+        report.inserted += inserted
+        report.updated += updated
+        report.unchanged += 1 - inserted - updated - len(rejected)
+
+
+def report_rejected(report: ImportReport, entries: List[tuple], rejected: dict):
+    for line, item in entries:
+        if item.sku in rejected:
+            report.add_error(
+                line,
+                item.sku,
+                f"Hay {rejected[item.sku]} unidades reservadas en pedidos pendientes",
+            )
+
+
+async def import_products(db, format: str, chunks) -> dict:
+    """Importa el cuerpo en lotes a medida que se recibe"""
+    parse = iter_csv if format == "csv" else iter_ndjson
+    report = ImportReport()
+    batch = []
+
+    async def flush():
+        await run_db(db, load_batch, list(batch), report)
+        batch.clear()
+        invalidate_catalog()
+        edge_cache.refresh_catalog()
+
+    async for line, record in parse(iter_lines(chunks)):
+        report.processed += 1
+        if isinstance(record, str):
+            report.add_error(line, None, record)
+            continue
+        try:
+            batch.append((line, ProductImport.model_validate(record)))
+        except ValidationError as e:
+            report.add_error(line, record.get("sku"), validation_message(e))
+            continue
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush()
+
+    if batch:
+        await flush()
+
+    return report.as_dict()
+
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+async def export_products(format: str, partitions):
+    """Convierte los lotes del cursor en fragmentos NDJSON o CSV"""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+        async for rows in partitions:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                [["" if v is None else export_value(v) for v in row] for row in rows]
+            )
+            yield buffer.getvalue()
+        return
+
+    async for rows in partitions:
+        yield "".join(
+            json.dumps(
+                dict(zip(EXPORT_FIELDS, map(export_value, row))), ensure_ascii=False
+            )
+            + "\n"
+            for row in rows
+        )
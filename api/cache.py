@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from contextlib import closing
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import engine, pin_primary
+import logging
+import os
+import select
+import psycopg2
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Caché de lectura del catálogo: tiempo de vida y cantidad máxima de entradas
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "30"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+
+# Invalidación entre workers/contenedores con LISTEN/NOTIFY de Postgres
+CATALOG_CACHE_NOTIFY = os.getenv("CATALOG_CACHE_NOTIFY", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+CATALOG_CHANNEL = "catalog_changed"
+
+MISSING = object()
+
+
+class TTLCache:
+    """Caché LRU acotada en tamaño con expiración por entrada, segura entre hilos"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Se incrementa en cada invalidación; evita guardar datos leídos antes
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation: int = None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+catalog_cache = TTLCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+
+
+async def cached(key, loader):
+    """Lectura a través de la caché: llama a loader() solo si no hay entrada"""
+    value = catalog_cache.get(key)
+    if value is MISSING:
+        generation = catalog_cache.generation
+        value = await loader()
+        catalog_cache.set(key, value, generation)
+    return value
+
+
+def notify_catalog_change(db: Session):
+    # NOTIFY se entrega al confirmar la transacción y se descarta si hay rollback
+    if CATALOG_CACHE_NOTIFY:
+        db.execute(text("SELECT pg_notify(:channel, '')"), {"channel": CATALOG_CHANNEL})
+
+
+def invalidate_catalog():
+    catalog_cache.clear()
+    # Una réplica atrasada volvería a llenar la caché con datos viejos: las
+    # próximas lecturas del proceso van al primario
+    pin_primary()
+
+
+class CatalogListener(threading.Thread):
+    """Escucha el canal de Postgres y vacía la caché local al recibir un aviso"""
+
+    def __init__(self):
+        super().__init__(name="catalog-listener", daemon=True)
+        self.stopping = threading.Event()
+
+    def run(self):
+        dsn = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        while not self.stopping.is_set():
+            try:
+                # closing: la conexión se cierra también si falla, así una base
+                # inestable no acumula una conexión abierta por reintento
+                with closing(psycopg2.connect(dsn)) as conn:
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"LISTEN {CATALOG_CHANNEL}")
+                    # Los avisos perdidos sin conexión se cubren vaciando la caché
+                    invalidate_catalog()
+                    while not self.stopping.is_set():
+                        if select.select([conn], [], [], 1.0)[0]:
+                            conn.poll()
+                            if conn.notifies:
+                                conn.notifies.clear()
+                                invalidate_catalog()
+            except psycopg2.Error:
+                logger.exception("Error en el listener de invalidación del catálogo")
+                self.stopping.wait(5)
+
+    def stop(self):
+        self.stopping.set()
+
+
+listener = None
+
+
+def start_listener():
+    global listener
+    if CATALOG_CACHE_NOTIFY and listener is None:
+        listener = CatalogListener()
+        listener.start()
+
+
+def stop_listener():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def stats() -> dict:
+    return {**catalog_cache.stats(), "notify": CATALOG_CACHE_NOTIFY}
@@ -0,0 +1,145 @@
+from datetime import datetime, timezone
+from sqlalchemy import DateTime, Integer, bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import DBAPIError
+from database import SessionLocal
+from models.cart import Cart
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre escrituras de la actividad acumulada de los carritos
+CART_ACTIVITY_FLUSH_INTERVAL = float(os.getenv("CART_ACTIVITY_FLUSH_INTERVAL", "5"))
+
+# Último instante de actividad por usuario pendiente de escribir. Varias
+# modificaciones del mismo carrito dentro de un intervalo se funden en una
+_pending = {}
+_lock = threading.Lock()
+_touches = 0
+_flushes = 0
+_flushed = 0
+_failures = 0
+
+
+def touch(user_id: int):
+    """Registra actividad en el carrito del usuario sin tocar la base"""
+    global _touches
+    now = datetime.now(timezone.utc)
+    with _lock:
+        _pending[user_id] = now
+        _touches += 1
+
+
+def build_flush():
+    activity = (
+        func.unnest(
+            bindparam("user_ids", type_=ARRAY(Integer)),
+            bindparam("touched_at", type_=ARRAY(DateTime(timezone=True))),
+        )
+        .table_valued("user_id", "touched_at")
+        .render_derived()
+    )
+    carts = Cart.__table__
+    # Filas bloqueadas en orden de id para que dos workers no se bloqueen
+    # mutuamente; FOR NO KEY UPDATE no espera a los INSERT de items (FK)
+    locked = (
+        select(carts.c.id)
+        .where(carts.c.user_id.in_(select(activity.c.user_id)))
+        .order_by(carts.c.id)
+        .with_for_update(key_share=True)
+    )
+    return update(carts).where(
+        carts.c.user_id == activity.c.user_id,
+        carts.c.id.in_(locked),
+        # Otro worker pudo escribir una actividad más reciente
+        func.coalesce(carts.c.updated_at, carts.c.created_at) < activity.c.touched_at,
+    ).values(updated_at=activity.c.touched_at)
+
+
+FLUSH_CART_ACTIVITY = build_flush()
+
+
+def flush() -> int:
+    """Escribe la actividad pendiente en un solo UPDATE; devuelve los carritos"""
+    global _pending, _flushes, _flushed, _failures
+    with _lock:
+        batch, _pending = _pending, {}
+    if not batch:
+        return 0
+
+    user_ids = sorted(batch)
+    try:
+        with SessionLocal() as db:
+            db.execute(
+                FLUSH_CART_ACTIVITY,
+                {"user_ids": user_ids, "touched_at": [batch[uid] for uid in user_ids]},
+            )
+            db.commit()
+    except DBAPIError:
+        # Se reintenta en la próxima ronda sin perder actividad más reciente
+        with _lock:
+            for user_id, touched_at in batch.items():
+                if _pending.get(user_id, touched_at) <= touched_at:
+                    _pending[user_id] = touched_at
+            _failures += 1
+        raise
+
+    _flushes += 1
+    _flushed += len(batch)
+    return len(batch)
+
+
+class CartActivityFlusher(threading.Thread):
+    """Vuelca periódicamente la actividad de los carritos de este proceso"""
+
+    def __init__(self):
+        super().__init__(name="cart-activity-flusher", daemon=True)
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(CART_ACTIVITY_FLUSH_INTERVAL):
+            self.flush()
+        # Lo acumulado desde la última ronda se escribe antes de salir
+        self.flush()
+
+    def flush(self):
+        try:
+            flush()
+        except Exception:
+            logger.exception("Error al registrar la actividad de los carritos")
+
+    def stop(self):
+        self.stopping.set()
+
+
+flusher = None
+
+
+def start_flusher():
+    global flusher
+    if flusher is None:
+        flusher = CartActivityFlusher()
+        flusher.start()
+
+
+def stop_flusher():
+    global flusher
+    if flusher is not None:
+        flusher.stop()
+        flusher.join(timeout=CART_ACTIVITY_FLUSH_INTERVAL + 5)
+        flusher = None
+
+
+def stats() -> dict:
+    with _lock:
+        pending = len(_pending)
+    return {
+        "flush_interval": CART_ACTIVITY_FLUSH_INTERVAL,
+        "pending": pending,
+        "touches": _touches,
+        "flushes": _flushes,
+        "flushed": _flushed,
+        "failures": _failures,
+    }
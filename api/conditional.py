@@ -0,0 +1,54 @@
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+from typing import NamedTuple, Union
+from decimal import Decimal
+import hashlib
+import orjson
+
+
+class JSONPayload(NamedTuple):
+    """Respuesta JSON ya serializada junto con su ETag"""
+
+    body: bytes
+    etag: str
+
+
+def json_default(value):
+    # Decimal como texto, igual que Pydantic en modo JSON
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def dump_json(content: Union[BaseModel, dict, list]) -> bytes:
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode("utf-8")
+    # Camino rápido: filas ya proyectadas a dicts/listas se codifican con
+    # orjson sin construir ni validar modelos de Pydantic
+    return orjson.dumps(content, default=json_default)
+
+
+def serialize(content: Union[BaseModel, dict, list]) -> JSONPayload:
+    body = dump_json(content)
+    return JSONPayload(body, f'"{hashlib.sha1(body).hexdigest()}"')
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Comparación débil: se ignora el prefijo W/ que agregan algunos proxies
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def conditional_response(
+    request: Request, payload: JSONPayload, cache_control: str = "no-cache"
+) -> Response:
+    """Devuelve 304 si el cliente ya tiene esta versión, si no el cuerpo completo"""
+    headers = {"ETag": payload.etag, "Cache-Control": cache_control}
+    if etag_matches(request, payload.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(payload.body, media_type="application/json", headers=headers)
@@ -0,0 +1,120 @@
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from database import READ_YOUR_WRITES_WINDOW
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Listener interno de nginx que vuelve a pedir una URL a la API y reemplaza
+# la copia de su micro-caché (vacío = sin caché en el proxy)
+EDGE_CACHE_REFRESH_URL = os.getenv("EDGE_CACHE_REFRESH_URL", "").rstrip("/")
+# Espera antes de refrescar para que los demás workers reciban el NOTIFY y
+# vacíen su caché local; timeout de cada request de refresco
+EDGE_CACHE_REFRESH_DELAY = float(os.getenv("EDGE_CACHE_REFRESH_DELAY", "0.5"))
+EDGE_CACHE_REFRESH_TIMEOUT = float(os.getenv("EDGE_CACHE_REFRESH_TIMEOUT", "5"))
+
+# Páginas que reflejan cualquier cambio del catálogo. Las demás variantes
+# (filtros, búsquedas) vencen solas con el TTL corto del proxy
+CATALOG_PATHS = ("/api/v1/products/", "/api/v1/products/featured")
+
+# URLs pendientes de refrescar; varias escrituras seguidas se funden en una
+_pending = set()
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_refreshes = 0
+_failures = 0
+
+
+def refresh_catalog(*product_ids: int):
+    """Pide al proxy que renueve el listado y el detalle de los productos"""
+    if not EDGE_CACHE_REFRESH_URL:
+        return
+    with _lock:
+        _pending.update(CATALOG_PATHS)
+        _pending.update(f"/api/v1/products/{product_id}" for product_id in product_ids)
+    _wakeup.set()
+
+
+def refresh(path: str):
+    # Leer del primario: una réplica atrasada dejaría la copia vieja en el proxy
+    request = Request(
+        EDGE_CACHE_REFRESH_URL + path,
+        headers={"X-Read-Primary-Until": f"{time.time() + READ_YOUR_WRITES_WINDOW:.3f}"},
+    )
+    try:
+        # 404 también se guarda: reemplaza al detalle de un producto borrado
+        with urlopen(request, timeout=EDGE_CACHE_REFRESH_TIMEOUT) as response:
+            response.read()
+    except HTTPError as e:
+        if e.code != 404:
+            raise
+
+
+def flush() -> int:
+    """Refresca las URLs pendientes; devuelve cuántas se renovaron"""
+    global _pending, _refreshes, _failures
+    with _lock:
+        batch, _pending = _pending, set()
+    refreshed = 0
+    for path in sorted(batch):
+        try:
+            refresh(path)
+        except (OSError, ValueError):
+            logger.exception("Error al refrescar %s en la caché del proxy", path)
+            with _lock:
+                _failures += 1
+            continue
+        refreshed += 1
+    with _lock:
+        _refreshes += refreshed
+    return refreshed
+
+
+class EdgeCacheRefresher(threading.Thread):
+    """Renueva en segundo plano las páginas del catálogo cacheadas por nginx"""
+
+    def __init__(self):
+        super().__init__(name="edge-cache-refresher", daemon=True)
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            _wakeup.wait()
+            _wakeup.clear()
+            if self.stopping.wait(EDGE_CACHE_REFRESH_DELAY):
+                break
+            flush()
+
+    def stop(self):
+        self.stopping.set()
+        _wakeup.set()
+
+
+refresher = None
+
+
+def start_refresher():
+    global refresher
+    if EDGE_CACHE_REFRESH_URL and refresher is None:
+        refresher = EdgeCacheRefresher()
+        refresher.start()
+
+
+def stop_refresher():
+    global refresher
+    if refresher is not None:
+        refresher.stop()
+        refresher = None
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "enabled": bool(EDGE_CACHE_REFRESH_URL),
+            "pending": len(_pending),
+            "refreshes": _refreshes,
+            "failures": _failures,
+        }
@@ -0,0 +1,64 @@
+# Configuración de Gunicorn para producción: varios workers de Uvicorn
+import multiprocessing
+import os
+import shutil
+
+
+def env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Un worker por núcleo por defecto; cada uno tiene su propio event loop y pool
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Importar la aplicación en el master antes del fork acelera el arranque
+preload_app = env_flag("GUNICORN_PRELOAD", "true")
+
+# Reciclar workers tras N requests (con jitter para no reiniciarlos a la vez)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Mayor que el keepalive_timeout de los upstreams de nginx (60s) para que
+# sea nginx quien cierre las conexiones ociosas y no reciba un reset
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+
+accesslog = "-"
+errorlog = "-"
+
+# Directorio compartido de métricas de Prometheus entre workers. Se prepara al
+# leer esta configuración y no en on_starting porque con preload_app la
+# aplicación (que registra el colector) se importa antes de ese hook. Gunicorn
+# vuelve a leer este archivo en cada HUP: solo se vacía en el primer arranque
+# para no borrar los archivos de los workers vivos
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    if not os.getenv("GUNICORN_METRICS_READY"):
+        shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+        os.environ["GUNICORN_METRICS_READY"] = "1"
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # Con preload_app los pools se crearon en el master: cada worker abre los suyos
+    from database import async_engine, engine, replicas
+
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+    for replica in replicas:
+        replica.engine.dispose(close=False)
+        if replica.async_engine is not None:
+            replica.async_engine.sync_engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
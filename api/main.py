@@ -1,11 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from database import get_db
-from routes import users, products, carts
+from database import (
+    DbSession,
+    ReadYourWritesMiddleware,
+    active_engine,
+    get_db,
+    pool_status,
+    replica_engines,
+    replica_status,
+    run_db,
+    start_replica_monitor,
+    stop_replica_monitor,
+)
+from routes import users, products, carts, orders
+from contextlib import asynccontextmanager
+import cache
+import cart_activity
+import edge_cache
+import metrics
+import reservations
+import security
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_replica_monitor()
+    cache.start_listener()
+    reservations.start_sweeper()
+    cart_activity.start_flusher()
+    edge_cache.start_refresher()
+    yield
+    # Liberar los recursos del proceso al detener el servidor
+    cache.stop_listener()
+    reservations.stop_sweeper()
+    cart_activity.stop_flusher()
+    edge_cache.stop_refresher()
+    stop_replica_monitor()
+    security.shutdown()
+
 
-# Crear la instancia de FastAPI
-app = FastAPI(title="Tienda Virtual API", version="1.0.0")
+# Crear la instancia de FastAPI; las respuestas JSON se codifican con orjson
+app = FastAPI(
+    title="Tienda Virtual API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # Configurar CORS
 app.add_middleware(
@@ -16,10 +59,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Lecturas de réplica consistentes con las escrituras del cliente
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Métricas por ruta y consultas SQL por request
+app.add_middleware(metrics.MetricsMiddleware)
+for query_engine in [active_engine(), *replica_engines()]:
+    metrics.install_query_hooks(query_engine)
+metrics_registry = metrics.create_registry(
+    {
+        "password_hashing": security.stats,
+        "product_cache": cache.stats,
+        "db_pool": pool_status,
+        "db_replicas": replica_status,
+        "reservations": reservations.stats,
+        "cart_activity": cart_activity.stats,
+        "edge_cache": edge_cache.stats,
+    }
+)
+
 # Incluir los routers
 app.include_router(users.router, prefix="/api/v1/users", tags=["users"])
 app.include_router(products.router, prefix="/api/v1/products", tags=["products"])
 app.include_router(carts.router, prefix="/api/v1/carts", tags=["carts"])
+app.include_router(orders.router, prefix="/api/v1/orders", tags=["orders"])
 
 
 @app.get("/")
@@ -31,3 +94,38 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/health/ready")
+async def readiness_check(db: DbSession = Depends(get_db)):
+    # Listo solo si la base de datos responde
+    try:
+        await run_db(db, lambda db: db.execute(text("SELECT 1")))
+    except Exception:
+        # asyncpg puede lanzar sus propias excepciones al conectar
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "database": "error"},
+        )
+    return {"status": "ready", "database": "ok"}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.render(metrics_registry)
+    return Response(body, media_type=content_type)
+
+
+@app.get("/stats")
+async def runtime_stats():
+    # Estado interno del proceso para diagnóstico
+    return {
+        "password_hashing": security.stats(),
+        "product_cache": cache.stats(),
+        "db_pool": pool_status(),
+        "db_replicas": replica_status(),
+        "reservations": reservations.stats(),
+        "cart_activity": cart_activity.stats(),
+        "edge_cache": edge_cache.stats(),
+    }
+
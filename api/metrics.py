@@ -0,0 +1,172 @@
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+import contextvars
+import os
+import time
+
+REQUESTS = Counter(
+    "api_requests_total",
+    "Requests atendidos por método, ruta y código de estado",
+    ["method", "route", "status"],
+)
+LATENCY = Histogram(
+    "api_request_duration_seconds",
+    "Latencia de los requests por método y ruta",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+IN_FLIGHT = Gauge(
+    "api_requests_in_flight",
+    "Requests en curso por método y ruta",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+DB_QUERIES = Histogram(
+    "api_db_queries_per_request",
+    "Consultas SQL ejecutadas por request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_TIME = Histogram(
+    "api_db_time_per_request_seconds",
+    "Tiempo total en la base de datos por request",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+# [consultas, segundos] del request en curso; la lista es compartida con los
+# hilos y greenlets que ejecutan las consultas porque copian el contexto
+request_db_stats = contextvars.ContextVar("request_db_stats", default=None)
+
+
+def install_query_hooks(engine: Engine):
+    """Registra eventos de SQLAlchemy para contar y medir consultas por request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def route_template(scope) -> str:
+    # Etiquetar con la plantilla (/api/v1/products/{product_id}) y no con la
+    # URL concreta para mantener acotada la cardinalidad de las métricas
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI con conteo, latencia y requests en curso por ruta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        status_code = 500
+        db_stats = [0, 0.0]
+        token = request_db_stats.set(db_stats)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        IN_FLIGHT.labels(method, route).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            IN_FLIGHT.labels(method, route).dec()
+            DB_QUERIES.labels(route).observe(db_stats[0])
+            DB_TIME.labels(route).observe(db_stats[1])
+            request_db_stats.reset(token)
+
+
+class RuntimeCollector:
+    """Expone como métricas el estado del pool, la caché y el pool de bcrypt"""
+
+    def __init__(self, sources):
+        # sources: {"prefijo": función que devuelve un dict de valores}
+        self.sources = sources
+
+    def collect(self):
+        for prefix, source in self.sources.items():
+            for name, value in source().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"api_{prefix}_{name}"
+                if name in COUNTER_FIELDS:
+                    yield CounterMetricFamily(metric, f"{prefix} {name}", value=value)
+                else:
+                    yield GaugeMetricFamily(metric, f"{prefix} {name}", value=value)
+
+
+# Campos de los dicts de estado que solo crecen
+COUNTER_FIELDS = {
+    "checkouts",
+    "wait_seconds_total",
+    "overflow_checkouts",
+    "timeouts",
+    "hits",
+    "misses",
+    "evictions",
+    "invalidations",
+    "completed",
+    "rejected",
+    "expired",
+    "sweeps",
+    "touches",
+    "flushes",
+    "flushed",
+    "failures",
+    "refreshes",
+    "primary_reads",
+    "replica_reads",
+}
+
+
+def create_registry(sources) -> CollectorRegistry:
+    # Con varios workers (PROMETHEUS_MULTIPROC_DIR) se agregan los archivos de
+    # todos los procesos; el estado en memoria es el del worker que responde
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    registry.register(RuntimeCollector(sources))
+    return registry
+
+
+def render(registry: CollectorRegistry):
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,45 @@
+"""Aplica las migraciones pendientes; el contenedor lo corre antes de Gunicorn.
+
+Las bases creadas con el antiguo database/schema.sql tienen las tablas pero
+no la tabla de versiones de Alembic: se marcan en la revisión inicial, que
+describe ese mismo esquema, y siguen desde ahí.
+"""
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, pool, text
+from database import DATABASE_URL
+import os
+
+BASELINE_REVISION = "0001"
+# Varias réplicas de la API pueden arrancar a la vez: una migra, las demás esperan
+MIGRATION_LOCK = 727274
+
+
+def alembic_config() -> Config:
+    return Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+
+
+def migrate(url: str = DATABASE_URL, revision: str = "head"):
+    config = alembic_config()
+    engine = create_engine(url, poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK})
+        connection.commit()
+        try:
+            config.attributes["connection"] = connection
+            tables = inspect(connection).get_table_names()
+            # Alembic confirma sus propias transacciones
+            connection.commit()
+            if "products" in tables and "alembic_version" not in tables:
+                command.stamp(config, BASELINE_REVISION)
+            command.upgrade(config, revision)
+        finally:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK}
+            )
+            connection.commit()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    migrate()
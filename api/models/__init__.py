@@ -1,5 +1,6 @@
 from models.user import User
 from models.product import Product
 from models.cart import Cart, CartItem
+from models.order import Order, OrderItem
 
-__all__ = ["User", "Product", "Cart", "CartItem"]
+__all__ = ["User", "Product", "Cart", "CartItem", "Order", "OrderItem"]
@@ -1,4 +1,12 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -7,38 +15,56 @@ from database import Base
 class Cart(Base):
     __tablename__ = "carts"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(
-        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
+    # Un carrito por usuario; el índice único también sirve las búsquedas.
+    # updated_at refleja la última modificación de los items (cart_activity)
+    # y su índice sirve la consulta de carritos abandonados
+    __table_args__ = (
+        UniqueConstraint("user_id", name="uq_carts_user_id"),
+        Index("idx_carts_updated_at", "updated_at"),
+    )
+
     # Definir relaciones
     user = relationship("User", backref="carts")
     items = relationship(
-        "CartItem", back_populates="cart", cascade="all, delete-orphan"
+        "CartItem",
+        back_populates="cart",
+        cascade="all, delete-orphan",
+        order_by="CartItem.id",
     )
 
 
 class CartItem(Base):
     __tablename__ = "cart_items"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     cart_id = Column(
-        Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False, index=True
+        Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False
     )
     product_id = Column(
         Integer,
         ForeignKey("products.id", ondelete="CASCADE"),
         nullable=False,
-        index=True,
     )
     quantity = Column(Integer, nullable=False, default=1)
     added_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Un item por producto en cada carrito (objetivo del UPSERT de add-to-cart);
+    # el índice por producto sirve el ON DELETE CASCADE desde products
+    __table_args__ = (
+        UniqueConstraint("cart_id", "product_id", name="uq_cart_items_cart_product"),
+        Index("idx_cart_items_product_id", "product_id"),
+        CheckConstraint("quantity > 0", name="ck_cart_items_quantity_positive"),
+    )
+
     # Definir relaciones
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product")
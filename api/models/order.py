@@ -0,0 +1,73 @@
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+)
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from database import Base
+
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    # pending: stock reservado hasta expires_at; paid, cancelled o expired
+    status = Column(String(20), nullable=False, default="pending")
+    total = Column(Numeric(12, 2), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("idx_orders_user_id_id", user_id, id),
+        # Solo las reservas vigentes, recorridas por el barrido de expiración
+        Index(
+            "idx_orders_pending_expires",
+            expires_at,
+            postgresql_where=status == "pending",
+        ),
+    )
+
+    # Definir relaciones
+    items = relationship(
+        "OrderItem",
+        back_populates="order",
+        cascade="all, delete-orphan",
+        order_by="OrderItem.product_id",
+    )
+
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(
+        Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False
+    )
+    product_id = Column(
+        Integer, ForeignKey("products.id", ondelete="RESTRICT"), nullable=False
+    )
+    quantity = Column(Integer, nullable=False)
+    # Precio al momento de la compra
+    unit_price = Column(Numeric(10, 2), nullable=False)
+
+    # Por producto: la verificación del ON DELETE RESTRICT al borrar un
+    # producto no recorre todos los items de pedidos. Una cantidad no
+    # positiva sumaría stock al reservarla
+    __table_args__ = (
+        Index("idx_order_items_order_id", order_id),
+        Index("idx_order_items_product_id", product_id),
+        CheckConstraint("quantity > 0", name="ck_order_items_quantity_positive"),
+    )
+
+    # Definir relaciones
+    order = relationship("Order", back_populates="items")
+    product = relationship("Product")
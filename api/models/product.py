@@ -1,4 +1,17 @@
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, Text
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    Computed,
+    DateTime,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from database import Base
 
@@ -6,13 +19,55 @@ from database import Base
 class Product(Base):
     __tablename__ = "products"
 
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(255), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    # Código del proveedor, clave natural para importaciones masivas
+    sku = Column(String(64))
+    name = Column(String(255), nullable=False)
     description = Column(Text)
     price = Column(Numeric(10, 2), nullable=False)
     stock = Column(Integer, default=0)
     image_url = Column(String(500))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Documento de búsqueda generado por Postgres (el nombre pesa más que la
+    # descripción); diferido para no transferirlo en las consultas normales
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('spanish', coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+        )
+    )
+
+    # Índices para la paginación por cursor y los filtros del listado (el de
+    # (name, id) también sirve las búsquedas por nombre)
+    __table_args__ = (
+        UniqueConstraint("sku", name="uq_products_sku"),
+        # Garantía de no sobreventa: un descuento que deje stock negativo falla
+        CheckConstraint("stock >= 0", name="ck_products_stock_nonnegative"),
+        Index("idx_products_created_at_id", created_at, id),
+        Index("idx_products_price_id", price, id),
+        Index("idx_products_name_id", name, id),
+        Index(
+            "idx_products_name_prefix",
+            func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+        Index(
+            "idx_products_in_stock", created_at, id, postgresql_where=stock > 0
+        ),
+        # Búsqueda de texto completo y similitud por trigramas (pg_trgm)
+        Index("idx_products_search", search_vector, postgresql_using="gin"),
+        Index(
+            "idx_products_name_trgm",
+            name,
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+
     def __repr__(self):
         return f"<Product(id={self.id}, name='{self.name}', price={self.price})>"
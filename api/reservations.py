@@ -0,0 +1,215 @@
+from datetime import timedelta
+from sqlalchemy import Integer, bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from cache import invalidate_catalog, notify_catalog_change
+from models.order import Order, OrderItem
+from models.product import Product
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Segundos que un pedido pendiente retiene el stock antes de liberarlo
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "900"))
+# Frecuencia del barrido de reservas vencidas y pedidos liberados por ronda
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("RESERVATION_SWEEP_INTERVAL", "30"))
+RESERVATION_SWEEP_BATCH = int(os.getenv("RESERVATION_SWEEP_BATCH", "100"))
+
+_expired = 0
+_sweeps = 0
+
+
+def reservation_deadline():
+    # Calculado por Postgres para comparar siempre contra el mismo reloj
+    return func.now() + timedelta(seconds=RESERVATION_TTL)
+
+
+def stock_update(sign: int):
+    """UPDATE de stock para varios productos en una sola sentencia.
+
+    Las filas se bloquean primero en orden de id (subconsulta FOR NO KEY
+    UPDATE) para que dos pedidos con productos en común no se bloqueen
+    mutuamente. Al descontar solo se actualizan (y devuelven) los productos
+    con stock suficiente y una cantidad positiva: una cantidad negativa
+    sumaría stock en lugar de reservarlo.
+    """
+    changes = (
+        func.unnest(
+            bindparam("product_ids", type_=ARRAY(Integer)),
+            bindparam("quantities", type_=ARRAY(Integer)),
+        )
+        .table_valued("product_id", "quantity")
+        .render_derived()
+    )
+    products = Product.__table__
+    locked = (
+        select(products.c.id)
+        .where(products.c.id.in_(select(changes.c.product_id)))
+        .order_by(products.c.id)
+        .with_for_update(key_share=True)
+    )
+    statement = update(products).where(
+        products.c.id == changes.c.product_id, products.c.id.in_(locked)
+    )
+    if sign < 0:
+        statement = statement.where(
+            changes.c.quantity > 0, products.c.stock >= changes.c.quantity
+        )
+    return statement.values(stock=products.c.stock + sign * changes.c.quantity).returning(
+        products.c.id, products.c.stock
+    )
+
+
+RESERVE_STOCK = stock_update(-1)
+RESTORE_STOCK = stock_update(1)
+
+
+def reserved_stock(db: Session, product_ids) -> dict:
+    """Unidades retenidas por pedidos pendientes de cada producto.
+
+    products.stock es lo disponible para vender: ya descuenta estas unidades,
+    que vuelven al stock si el pedido se cancela o expira. Una escritura
+    absoluta del stock (admin, importación) recibe la existencia física y debe
+    restarles lo reservado; si no, al liberar la reserva el stock crece.
+    Quien llama debe haber bloqueado antes las filas de los productos (FOR NO
+    KEY UPDATE, como las reservas) para ver las reservas confirmadas entretanto.
+    """
+    return dict(
+        db.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+        .join(Order, Order.id == OrderItem.order_id)
+        .filter(OrderItem.product_id.in_(product_ids), Order.status == "pending")
+        .group_by(OrderItem.product_id)
+        .all()
+    )
+
+
+def pending_quantities():
+    """Unidades retenidas por pedidos pendientes agrupadas por producto"""
+    return (
+        select(OrderItem.product_id, func.sum(OrderItem.quantity).label("quantity"))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.status == "pending")
+        .group_by(OrderItem.product_id)
+        .subquery()
+    )
+
+
+def stock_params(quantities: dict) -> dict:
+    product_ids = sorted(quantities)
+    return {
+        "product_ids": product_ids,
+        "quantities": [quantities[pid] for pid in product_ids],
+    }
+
+
+def reserve_stock(db: Session, quantities: dict):
+    """Descuenta el stock de todos los productos dentro de la transacción de db.
+
+    Devuelve {product_id: stock restante}, o None si algún producto no existe,
+    no tiene stock suficiente o su cantidad no es positiva. En ese caso pueden
+    haberse descontado otros productos: quien llama debe hacer rollback de la
+    transacción completa.
+    """
+    remaining = dict(db.execute(RESERVE_STOCK, stock_params(quantities)).all())
+    if len(remaining) < len(quantities):
+        return None
+    return remaining
+
+
+def release_stock(db: Session, order_ids) -> bool:
+    """Devuelve al stock los items de los pedidos; True si algún producto
+    agotado vuelve a estar disponible"""
+    quantities = dict(
+        db.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+        .filter(OrderItem.order_id.in_(order_ids))
+        .group_by(OrderItem.product_id)
+        .all()
+    )
+    if not quantities:
+        return False
+    restocked = db.execute(RESTORE_STOCK, stock_params(quantities)).all()
+    return any(stock == quantities[pid] for pid, stock in restocked)
+
+
+def expire_reservations(db: Session) -> int:
+    """Libera una ronda de pedidos pendientes vencidos"""
+    global _expired
+
+    # SKIP LOCKED: varios workers barren en paralelo sin esperarse entre sí ni
+    # bloquear un pago o cancelación en curso sobre el mismo pedido
+    order_ids = [
+        order_id
+        for (order_id,) in db.query(Order.id)
+        .filter(Order.status == "pending", Order.expires_at <= func.now())
+        .order_by(Order.expires_at)
+        .limit(RESERVATION_SWEEP_BATCH)
+        .with_for_update(skip_locked=True)
+        .all()
+    ]
+    if not order_ids:
+        db.rollback()
+        return 0
+
+    restocked = release_stock(db, order_ids)
+    db.query(Order).filter(Order.id.in_(order_ids)).update(
+        {Order.status: "expired"}, synchronize_session=False
+    )
+    if restocked:
+        notify_catalog_change(db)
+    db.commit()
+    if restocked:
+        invalidate_catalog()
+
+    _expired += len(order_ids)
+    return len(order_ids)
+
+
+class ReservationSweeper(threading.Thread):
+    """Expira periódicamente las reservas vencidas de este proceso"""
+
+    def __init__(self):
+        super().__init__(name="reservation-sweeper", daemon=True)
+        self.stopping = threading.Event()
+
+    def run(self):
+        global _sweeps
+        while not self.stopping.wait(RESERVATION_SWEEP_INTERVAL):
+            try:
+                with SessionLocal() as db:
+                    while expire_reservations(db) == RESERVATION_SWEEP_BATCH:
+                        pass
+                _sweeps += 1
+            except Exception:
+                logger.exception("Error al expirar reservas de stock")
+
+    def stop(self):
+        self.stopping.set()
+
+
+sweeper = None
+
+
+def start_sweeper():
+    global sweeper
+    if sweeper is None:
+        sweeper = ReservationSweeper()
+        sweeper.start()
+
+
+def stop_sweeper():
+    global sweeper
+    if sweeper is not None:
+        sweeper.stop()
+        sweeper = None
+
+
+def stats() -> dict:
+    return {
+        "ttl_seconds": RESERVATION_TTL,
+        "sweep_interval": RESERVATION_SWEEP_INTERVAL,
+        "expired": _expired,
+        "sweeps": _sweeps,
+    }
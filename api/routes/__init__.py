@@ -1,3 +1,3 @@
-from routes import users, products, carts
+from routes import users, products, carts, orders
 
-__all__ = ["users", "products", "carts"]
+__all__ = ["users", "products", "carts", "orders"]
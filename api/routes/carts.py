@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import exists, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from database import get_db
+from decimal import Decimal
+from datetime import datetime, timedelta
+from enum import Enum
+from database import DbSession, get_db, get_read_db, run_db
+from security import CurrentUser, get_current_user, require_internal_token
+from conditional import conditional_response, serialize
 from models.cart import Cart, CartItem
 from models.product import Product
+import cart_activity
 
 router = APIRouter()
 
@@ -40,7 +48,7 @@ class CartItemResponse(BaseModel):
 
 
 class CartResponse(BaseModel):
-    id: int
+    id: Optional[int]
     user_id: int
     items: List[CartItemResponse]
 
@@ -48,140 +56,406 @@ class CartResponse(BaseModel):
         from_attributes = True
 
 
-class AddItemRequest(BaseModel):
+class AbandonedCart(BaseModel):
+    cart_id: int
     user_id: int
+    updated_at: datetime
+    item_count: int
+    total: Decimal
+
+
+class AddItemRequest(BaseModel):
     product_id: int
-    quantity: int = 1
+    quantity: int = Field(1, gt=0)
 
 
 class UpdateItemRequest(BaseModel):
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 
-@router.get("/", response_model=CartResponse)
-async def get_user_cart(user_id: int, db: Session = Depends(get_db)):
-    cart = db.query(Cart).filter(Cart.user_id == user_id).first()
+class CartOperationType(str, Enum):
+    add = "add"
+    set = "set"
+    remove = "remove"
 
-    if not cart:
-        # Crear carrito si no existe
-        cart = Cart(user_id=user_id)
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
 
-    # Cargar los items con el producto
-    items = db.query(CartItem).filter(CartItem.cart_id == cart.id).all()
+class CartOperation(BaseModel):
+    op: CartOperationType
+    product_id: int
+    # add: cantidad a sumar; set: cantidad final (0 elimina); remove: se ignora
+    quantity: int = Field(1, ge=0)
+
 
-    return {"id": cart.id, "user_id": cart.user_id, "items": items}
+class CartBatchRequest(BaseModel):
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=100)
 
 
-@router.post("/items", status_code=status.HTTP_201_CREATED)
-async def add_item_to_cart(item_data: AddItemRequest, db: Session = Depends(get_db)):
-    # Verificar que el producto existe
-    product = db.query(Product).filter(Product.id == item_data.product_id).first()
-    if not product:
+def get_or_create_cart_id(db: Session, user_id: int) -> int:
+    cart_id = db.query(Cart.id).filter(Cart.user_id == user_id).scalar()
+    if cart_id is None:
+        cart_id = db.execute(
+            insert(Cart)
+            .values(user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[Cart.user_id])
+            .returning(Cart.id)
+        ).scalar()
+    if cart_id is None:
+        # Otra transacción concurrente creó el carrito primero
+        cart_id = db.query(Cart.id).filter(Cart.user_id == user_id).scalar()
+    return cart_id
+
+
+def raise_add_item_error(db: Session, item_data: AddItemRequest):
+    # Solo en el camino de error: distinguir la causa para el mensaje
+    stock = db.query(Product.stock).filter(Product.id == item_data.product_id).scalar()
+    if stock is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado"
         )
-
-    if product.stock < item_data.quantity:
+    if stock < item_data.quantity:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Stock insuficiente"
         )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Stock insuficiente para la cantidad total",
+    )
 
-    # Buscar o crear carrito
-    cart = db.query(Cart).filter(Cart.user_id == item_data.user_id).first()
-    if not cart:
-        cart = Cart(user_id=item_data.user_id)
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
 
-    # Verificar si el producto ya está en el carrito
-    existing_item = (
-        db.query(CartItem)
-        .filter(
-            CartItem.cart_id == cart.id, CartItem.product_id == item_data.product_id
+def load_cart(db: Session, user_id: int) -> dict:
+    """Carrito con sus items y las columnas del producto en una sola consulta.
+
+    Se proyectan columnas y se arma el dict de CartResponse directamente: sin
+    cargar objetos del ORM ni validar el modelo, que para carritos grandes era
+    la mayor parte del costo del request.
+    """
+    rows = (
+        db.query(
+            Cart.id,
+            CartItem.id,
+            CartItem.product_id,
+            CartItem.quantity,
+            Product.id,
+            Product.name,
+            Product.price,
+            Product.image_url,
         )
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+        .outerjoin(Product, Product.id == CartItem.product_id)
+        .filter(Cart.user_id == user_id)
+        .order_by(CartItem.id)
+        .all()
+    )
+
+    # El carrito se crea con el primer item, una lectura no escribe
+    if not rows:
+        return {"id": None, "user_id": user_id, "items": []}
+
+    items = [
+        {
+            "id": item_id,
+            "product_id": product_id,
+            "quantity": quantity,
+            "product": {
+                "id": pid,
+                "name": name,
+                "price": float(price),
+                "image_url": image_url,
+            }
+            if pid is not None
+            else None,
+        }
+        for _, item_id, product_id, quantity, pid, name, price, image_url in rows
+        if item_id is not None
+    ]
+    return {"id": rows[0][0], "user_id": user_id, "items": items}
+
+
+def find_user_item(db: Session, item_id: int, user_id: int) -> CartItem:
+    # Solo items del carrito del usuario autenticado
+    item = (
+        db.query(CartItem)
+        .join(Cart, Cart.id == CartItem.cart_id)
+        .filter(CartItem.id == item_id, Cart.user_id == user_id)
         .first()
     )
 
-    if existing_item:
-        # Actualizar cantidad
-        new_quantity = existing_item.quantity + item_data.quantity
-        if product.stock < new_quantity:
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Item no encontrado en el carrito",
+        )
+
+    return item
+
+
+@router.get("/", response_model=CartResponse)
+async def get_user_cart(
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_read_db),
+):
+    cart = await run_db(db, load_cart, current_user.id)
+    return conditional_response(
+        request, serialize(cart), cache_control="private, no-cache"
+    )
+
+
+# Expone carritos de todos los usuarios: solo para tareas internas (header
+# X-Internal-Token), nunca a través del proxy público
+@router.get(
+    "/abandoned",
+    response_model=List[AbandonedCart],
+    dependencies=[Depends(require_internal_token)],
+)
+async def get_abandoned_carts(
+    inactive_minutes: int = Query(60, ge=1, le=60 * 24 * 90),
+    limit: int = Query(100, ge=1, le=500),
+    db: DbSession = Depends(get_read_db),
+):
+    def find_abandoned(db: Session):
+        # Carritos con items sin actividad desde el corte, del más antiguo al
+        # más reciente: recorre idx_carts_updated_at y se detiene en limit
+        stale = (
+            select(Cart.id, Cart.user_id, Cart.updated_at)
+            .where(
+                Cart.updated_at < func.now() - timedelta(minutes=inactive_minutes),
+                exists().where(CartItem.cart_id == Cart.id),
+            )
+            .order_by(Cart.updated_at, Cart.id)
+            .limit(limit)
+            .subquery()
+        )
+        rows = (
+            db.query(
+                stale.c.id,
+                stale.c.user_id,
+                stale.c.updated_at,
+                func.count(CartItem.id),
+                func.sum(CartItem.quantity * Product.price),
+            )
+            .join(CartItem, CartItem.cart_id == stale.c.id)
+            .join(Product, Product.id == CartItem.product_id)
+            .group_by(stale.c.id, stale.c.user_id, stale.c.updated_at)
+            .order_by(stale.c.updated_at, stale.c.id)
+            .all()
+        )
+        return [
+            AbandonedCart(
+                cart_id=cart_id,
+                user_id=user_id,
+                updated_at=updated_at,
+                item_count=item_count,
+                total=total,
+            )
+            for cart_id, user_id, updated_at, item_count, total in rows
+        ]
+
+    return await run_db(db, find_abandoned)
+
+
+@router.patch("/", response_model=CartResponse)
+async def update_cart(
+    batch: CartBatchRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    user_id = current_user.id
+
+    def apply_operations(db: Session):
+        cart_id = get_or_create_cart_id(db, user_id)
+
+        # Cantidades actuales, bloqueando las filas del carrito hasta el commit
+        current = dict(
+            db.query(CartItem.product_id, CartItem.quantity)
+            .filter(CartItem.cart_id == cart_id)
+            .with_for_update()
+            .all()
+        )
+
+        # Aplicar las operaciones en orden sobre una copia en memoria
+        quantities = dict(current)
+        for operation in batch.operations:
+            if operation.op == CartOperationType.add:
+                quantities[operation.product_id] = (
+                    quantities.get(operation.product_id, 0) + operation.quantity
+                )
+            elif operation.op == CartOperationType.set:
+                quantities[operation.product_id] = operation.quantity
+            else:
+                quantities[operation.product_id] = 0
+
+        touched = {operation.product_id for operation in batch.operations}
+        wanted = {pid for pid in touched if quantities[pid] > 0}
+
+        # Stock de todos los productos referenciados en una sola consulta
+        stock = {}
+        if wanted:
+            stock = dict(
+                db.query(Product.id, Product.stock)
+                .filter(Product.id.in_(wanted))
+                .with_for_update(read=True)
+                .all()
+            )
+
+        missing = sorted(wanted - stock.keys())
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Productos no encontrados: {missing}",
+            )
+
+        insufficient = sorted(
+            pid for pid in wanted if quantities[pid] > (stock[pid] or 0)
+        )
+        if insufficient:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Stock insuficiente para la cantidad total",
+                detail=f"Stock insuficiente para los productos: {insufficient}",
             )
-        existing_item.quantity = new_quantity
+
+        # Escribir solo las filas que cambian: un UPSERT multi-fila y un DELETE
+        upserts = [
+            {"cart_id": cart_id, "product_id": pid, "quantity": quantities[pid]}
+            for pid in sorted(wanted)
+            if quantities[pid] != current.get(pid)
+        ]
+        if upserts:
+            stmt = insert(CartItem).values(upserts)
+            db.execute(
+                stmt.on_conflict_do_update(
+                    constraint="uq_cart_items_cart_product",
+                    set_={"quantity": stmt.excluded.quantity},
+                )
+            )
+
+        removals = [pid for pid in touched - wanted if pid in current]
+        if removals:
+            db.query(CartItem).filter(
+                CartItem.cart_id == cart_id, CartItem.product_id.in_(removals)
+            ).delete(synchronize_session=False)
+
         db.commit()
-        db.refresh(existing_item)
-        return existing_item
-    else:
-        # Crear nuevo item
-        new_item = CartItem(
-            cart_id=cart.id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity,
+
+        return load_cart(db, user_id)
+
+    cart = await run_db(db, apply_operations)
+    cart_activity.touch(user_id)
+    return cart
+
+
+@router.post("/items", status_code=status.HTTP_201_CREATED)
+async def add_item_to_cart(
+    item_data: AddItemRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    user_id = current_user.id
+
+    def add_item(db: Session):
+        cart_id = get_or_create_cart_id(db, user_id)
+
+        # INSERT ... ON CONFLICT DO UPDATE: crea el item o suma la cantidad en
+        # una sola sentencia. El SELECT bloquea la fila del producto (FOR SHARE)
+        # y solo produce la fila si el stock alcanza para la cantidad pedida;
+        # la condición del DO UPDATE valida el stock contra la cantidad total.
+        candidate = (
+            select(literal(cart_id), Product.id, literal(item_data.quantity))
+            .where(
+                Product.id == item_data.product_id,
+                Product.stock >= item_data.quantity,
+            )
+            .with_for_update(read=True)
+        )
+        stmt = insert(CartItem).from_select(
+            ["cart_id", "product_id", "quantity"], candidate
         )
-        db.add(new_item)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_cart_items_cart_product",
+            set_={"quantity": CartItem.quantity + stmt.excluded.quantity},
+            where=(
+                select(Product.stock)
+                .where(Product.id == item_data.product_id)
+                .scalar_subquery()
+                >= CartItem.quantity + stmt.excluded.quantity
+            ),
+        ).returning(*CartItem.__table__.columns)
+
+        row = db.execute(stmt).first()
+        if row is None:
+            db.rollback()
+            raise_add_item_error(db, item_data)
+
         db.commit()
-        db.refresh(new_item)
-        return new_item
+        return dict(row._mapping)
+
+    item = await run_db(db, add_item)
+    cart_activity.touch(user_id)
+    return item
 
 
 @router.put("/items/{item_id}")
 async def update_cart_item(
-    item_id: int, item_data: UpdateItemRequest, db: Session = Depends(get_db)
+    item_id: int,
+    item_data: UpdateItemRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
 ):
-    item = db.query(CartItem).filter(CartItem.id == item_id).first()
+    def apply_update(db: Session):
+        item = find_user_item(db, item_id, current_user.id)
 
-    if not item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Item no encontrado en el carrito",
-        )
+        # Verificar stock
+        product = db.query(Product).filter(Product.id == item.product_id).first()
+        if product.stock < item_data.quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Stock insuficiente"
+            )
 
-    # Verificar stock
-    product = db.query(Product).filter(Product.id == item.product_id).first()
-    if product.stock < item_data.quantity:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Stock insuficiente"
-        )
+        item.quantity = item_data.quantity
+        db.commit()
+        db.refresh(item)
 
-    item.quantity = item_data.quantity
-    db.commit()
-    db.refresh(item)
+        return item
 
+    item = await run_db(db, apply_update)
+    cart_activity.touch(current_user.id)
     return item
 
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_item_from_cart(item_id: int, db: Session = Depends(get_db)):
-    item = db.query(CartItem).filter(CartItem.id == item_id).first()
+async def remove_item_from_cart(
+    item_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    def remove_item(db: Session):
+        item = find_user_item(db, item_id, current_user.id)
 
-    if not item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Item no encontrado en el carrito",
-        )
+        db.delete(item)
+        db.commit()
 
-    db.delete(item)
-    db.commit()
+    await run_db(db, remove_item)
+    cart_activity.touch(current_user.id)
 
     return None
 
 
 @router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
-async def clear_cart(user_id: int, db: Session = Depends(get_db)):
-    cart = db.query(Cart).filter(Cart.user_id == user_id).first()
+async def clear_cart(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    def remove_items(db: Session):
+        cart = db.query(Cart).filter(Cart.user_id == current_user.id).first()
 
-    if not cart:
-        return None
+        if not cart:
+            return
+
+        # Eliminar todos los items
+        db.query(CartItem).filter(CartItem.cart_id == cart.id).delete()
+        db.commit()
 
-    # Eliminar todos los items
-    db.query(CartItem).filter(CartItem.cart_id == cart.id).delete()
-    db.commit()
+    await run_db(db, remove_items)
+    cart_activity.touch(current_user.id)
 
     return None
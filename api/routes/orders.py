@@ -0,0 +1,299 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session, joinedload, selectinload
+from pydantic import BaseModel
+from typing import List, Optional
+from decimal import Decimal
+from datetime import datetime
+from database import DbSession, get_db, run_db
+from cache import invalidate_catalog, notify_catalog_change
+from models.cart import Cart, CartItem
+from models.order import Order, OrderItem
+from models.product import Product
+from reservations import (
+    release_stock,
+    reservation_deadline,
+    reserve_stock,
+)
+from security import CurrentUser, get_current_user
+
+router = APIRouter()
+
+
+class ProductInOrder(BaseModel):
+    id: int
+    name: str
+    image_url: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+
+class OrderItemResponse(BaseModel):
+    product_id: int
+    quantity: int
+    unit_price: Decimal
+    product: Optional[ProductInOrder]
+
+    class Config:
+        from_attributes = True
+
+
+class OrderResponse(BaseModel):
+    id: int
+    status: str
+    total: Decimal
+    created_at: datetime
+    expires_at: datetime
+    items: List[OrderItemResponse]
+
+    class Config:
+        from_attributes = True
+
+
+def order_query(db: Session, user_id: int):
+    return db.query(Order).filter(Order.user_id == user_id)
+
+
+def load_order(db: Session, order_id: int, user_id: int) -> OrderResponse:
+    order = (
+        order_query(db, user_id)
+        .options(
+            joinedload(Order.items)
+            .joinedload(OrderItem.product)
+            .load_only(Product.id, Product.name, Product.image_url)
+        )
+        .filter(Order.id == order_id)
+        .first()
+    )
+
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Pedido no encontrado"
+        )
+
+    return OrderResponse.model_validate(order)
+
+
+def raise_order_state_error(db: Session, order_id: int, user_id: int):
+    # Solo en el camino de error: distinguir la causa para el mensaje
+    order_status = (
+        order_query(db, user_id)
+        .with_entities(Order.status)
+        .filter(Order.id == order_id)
+        .scalar()
+    )
+    if order_status is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Pedido no encontrado"
+        )
+    if order_status == "pending":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="La reserva del pedido expiró",
+        )
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="El pedido no está pendiente de pago",
+    )
+
+
+@router.post(
+    "/checkout", response_model=OrderResponse, status_code=status.HTTP_201_CREATED
+)
+async def checkout(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    user_id = current_user.id
+
+    def place_order(db: Session):
+        # Una sola transacción: vaciar el carrito, descontar el stock y crear
+        # el pedido se confirman juntos o no se confirma nada
+        items = (
+            db.query(CartItem.id, CartItem.product_id, CartItem.quantity, Product.price)
+            .join(Cart, Cart.id == CartItem.cart_id)
+            .join(Product, Product.id == CartItem.product_id)
+            .filter(Cart.user_id == user_id)
+            .all()
+        )
+        if not items:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="El carrito está vacío"
+            )
+
+        quantities = {}
+        prices = {}
+        for _, product_id, quantity, price in items:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+            prices[product_id] = price
+
+        invalid = sorted(pid for pid, quantity in quantities.items() if quantity <= 0)
+        if invalid:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cantidades no válidas para los productos: {invalid}",
+            )
+
+        # Solo se vacían los items leídos: si otro checkout simultáneo ya los
+        # tomó, o el carrito cambió entretanto, el pedido no se confirma
+        cart_item_ids = [item_id for item_id, *_ in items]
+        deleted = db.execute(
+            delete(CartItem).where(CartItem.id.in_(cart_item_ids)).returning(CartItem.id)
+        ).all()
+        if len(deleted) != len(cart_item_ids):
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="El carrito cambió durante el checkout, intenta de nuevo",
+            )
+
+        # El stock se descuenta antes de insertar order_items: su clave foránea
+        # a products no debe tomar locks sobre esas filas antes que el UPDATE
+        remaining = reserve_stock(db, quantities)
+        if remaining is None:
+            db.rollback()
+            stock = dict(
+                db.query(Product.id, Product.stock)
+                .filter(Product.id.in_(quantities))
+                .all()
+            )
+            db.rollback()
+            insufficient = sorted(
+                pid
+                for pid, quantity in quantities.items()
+                if (stock.get(pid) or 0) < quantity
+            )
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Stock insuficiente para los productos: {insufficient}",
+            )
+
+        order = Order(
+            user_id=user_id,
+            status="pending",
+            total=sum(prices[pid] * quantity for pid, quantity in quantities.items()),
+            expires_at=reservation_deadline(),
+            items=[
+                OrderItem(product_id=pid, quantity=quantity, unit_price=prices[pid])
+                for pid, quantity in sorted(quantities.items())
+            ],
+        )
+        db.add(order)
+        db.flush()
+        order_id = order.id
+
+        # Las cantidades del catálogo en caché pueden quedar atrasadas hasta
+        # su TTL; solo se invalida cuando un producto se agota
+        sold_out = 0 in remaining.values()
+        if sold_out:
+            notify_catalog_change(db)
+        db.commit()
+
+        return load_order(db, order_id, user_id), sold_out
+
+    order, sold_out = await run_db(db, place_order)
+    if sold_out:
+        invalidate_catalog()
+
+    return order
+
+
+@router.get("/", response_model=List[OrderResponse])
+async def list_orders(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    def load_orders(db: Session):
+        orders = (
+            order_query(db, current_user.id)
+            .options(
+                selectinload(Order.items)
+                .joinedload(OrderItem.product)
+                .load_only(Product.id, Product.name, Product.image_url)
+            )
+            .order_by(Order.id.desc())
+            .limit(20)
+            .all()
+        )
+        return [OrderResponse.model_validate(order) for order in orders]
+
+    return await run_db(db, load_orders)
+
+
+@router.get("/{order_id}", response_model=OrderResponse)
+async def get_order(
+    order_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    return await run_db(db, load_order, order_id, current_user.id)
+
+
+@router.post("/{order_id}/pay", response_model=OrderResponse)
+async def pay_order(
+    order_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    user_id = current_user.id
+
+    def confirm_payment(db: Session):
+        # Una sola sentencia: si el barrido tomó el pedido, esta espera su lock
+        # y al reevaluar ya no lo encuentra pendiente
+        paid = (
+            order_query(db, user_id)
+            .filter(
+                Order.id == order_id,
+                Order.status == "pending",
+                Order.expires_at > func.now(),
+            )
+            .update({Order.status: "paid"}, synchronize_session=False)
+        )
+        if not paid:
+            db.rollback()
+            raise_order_state_error(db, order_id, user_id)
+
+        db.commit()
+        return load_order(db, order_id, user_id)
+
+    return await run_db(db, confirm_payment)
+
+
+@router.post("/{order_id}/cancel", response_model=OrderResponse)
+async def cancel_order(
+    order_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
+):
+    user_id = current_user.id
+
+    def cancel(db: Session):
+        order_id_locked = (
+            order_query(db, user_id)
+            .with_entities(Order.id)
+            .filter(Order.id == order_id, Order.status == "pending")
+            .with_for_update()
+            .scalar()
+        )
+        if order_id_locked is None:
+            db.rollback()
+            raise_order_state_error(db, order_id, user_id)
+
+        restocked = release_stock(db, [order_id])
+        order_query(db, user_id).filter(Order.id == order_id).update(
+            {Order.status: "cancelled"}, synchronize_session=False
+        )
+        if restocked:
+            notify_catalog_change(db)
+        db.commit()
+
+        return load_order(db, order_id, user_id), restocked
+
+    order, restocked = await run_db(db, cancel)
+    if restocked:
+        invalidate_catalog()
+
+    return order
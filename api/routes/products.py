@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, literal, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from decimal import Decimal
-from database import get_db
+from datetime import datetime
+from enum import Enum
+import base64
+import json
+import re
+from database import DbSession, get_db, get_read_db, run_db, stream_rows
+from cache import cached, invalidate_catalog, notify_catalog_change
+from conditional import conditional_response, serialize
 from models.product import Product
+from reservations import pending_quantities, reserved_stock
+import bulk
+import edge_cache
 
 router = APIRouter()
 
 
 class ProductResponse(BaseModel):
     id: int
+    sku: Optional[str]
     name: str
     description: Optional[str]
     price: Decimal
@@ -22,88 +36,482 @@ class ProductResponse(BaseModel):
 
 
 class ProductCreate(BaseModel):
+    sku: Optional[str] = Field(None, min_length=1, max_length=64)
     name: str
     description: Optional[str] = None
     price: Decimal
-    stock: int = 0
+    stock: int = Field(0, ge=0)
     image_url: Optional[str] = None
 
 
 class ProductUpdate(BaseModel):
+    sku: Optional[str] = Field(None, min_length=1, max_length=64)
     name: Optional[str] = None
     description: Optional[str] = None
     price: Optional[Decimal] = None
-    stock: Optional[int] = None
+    # Existencia física: el stock publicado descuenta las reservas pendientes
+    stock: Optional[int] = Field(None, ge=0)
     image_url: Optional[str] = None
 
 
-@router.get("/", response_model=List[ProductResponse])
-async def get_products(db: Session = Depends(get_db)):
-    products = db.query(Product).all()
-    return products
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[str]
+    limit: int
+
+
+class ProductSearchPage(BaseModel):
+    items: List[ProductResponse]
+    query: str
+    limit: int
+    offset: int
+    next_offset: Optional[int]
+
+
+class ProductSuggestion(BaseModel):
+    id: int
+    name: str
+
+    class Config:
+        from_attributes = True
+
+
+# Las lecturas del catálogo proyectan solo las columnas de ProductResponse y
+# las filas se codifican directo a JSON, sin instanciar el ORM ni Pydantic
+PRODUCT_FIELDS = list(ProductResponse.model_fields)
+PRODUCT_COLUMNS = [getattr(Product, field) for field in PRODUCT_FIELDS]
+
+
+def product_dicts(rows) -> List[dict]:
+    # Las columnas extra al final de la fila (p. ej. la del cursor) se ignoran
+    return [dict(zip(PRODUCT_FIELDS, row)) for row in rows]
+
+
+# Palabras de la búsqueda (letras y dígitos); el resto se descarta para que
+# la entrada del usuario nunca llegue como sintaxis de tsquery
+SEARCH_WORD = re.compile(r"[^\W_]+")
+MAX_SEARCH_TERMS = 8
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class FeaturedRanking(str, Enum):
+    newest = "newest"
+    cheapest = "cheapest"
+
+
+FEATURED_RANKINGS = {
+    FeaturedRanking.newest: (Product.created_at, True),
+    FeaturedRanking.cheapest: (Product.price, False),
+}
+
+
+class ProductSort(str, Enum):
+    id = "id"
+    newest = "newest"
+    price_asc = "price_asc"
+    price_desc = "price_desc"
+    name = "name"
+
+
+# Columna de ordenamiento y dirección de cada opción; el id desempata siempre
+# en la misma dirección para que (columna, id) sea una clave única del cursor
+SORT_OPTIONS = {
+    ProductSort.id: (None, False),
+    ProductSort.newest: (Product.created_at, True),
+    ProductSort.price_asc: (Product.price, False),
+    ProductSort.price_desc: (Product.price, True),
+    ProductSort.name: (Product.name, False),
+}
+
+# Conversión del valor guardado en el cursor al tipo de la columna
+CURSOR_PARSERS = {
+    ProductSort.newest: datetime.fromisoformat,
+    ProductSort.price_asc: Decimal,
+    ProductSort.price_desc: Decimal,
+    ProductSort.name: str,
+}
+
+
+def encode_cursor(sort: ProductSort, product) -> str:
+    column, _ = SORT_OPTIONS[sort]
+    value = getattr(product, column.key) if column is not None else None
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    raw = json.dumps([value, product.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(sort: ProductSort, cursor: str):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if sort in CURSOR_PARSERS:
+            value = CURSOR_PARSERS[sort](value)
+        return value, int(last_id)
+    except (ValueError, TypeError, ArithmeticError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido"
+        )
+
+
+@router.get("/", response_model=ProductPage)
+async def get_products(
+    request: Request,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: ProductSort = ProductSort.id,
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    in_stock: bool = False,
+    name_prefix: Optional[str] = Query(None, min_length=1, max_length=255),
+    db: DbSession = Depends(get_read_db),
+):
+    column, descending = SORT_OPTIONS[sort]
+    cursor_key = decode_cursor(sort, cursor) if cursor else None
+
+    # La columna de orden viaja en la fila aunque no sea parte de la respuesta
+    extra = [column] if column is not None and column.key not in PRODUCT_FIELDS else []
+
+    def list_products(db: Session):
+        query = db.query(*PRODUCT_COLUMNS, *extra)
+
+        # Filtros del lado del servidor
+        if min_price is not None:
+            query = query.filter(Product.price >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.price <= max_price)
+        if in_stock:
+            query = query.filter(Product.stock > 0)
+        if name_prefix:
+            query = query.filter(
+                func.lower(Product.name).startswith(
+                    name_prefix.lower(), autoescape=True
+                )
+            )
+
+        # Paginación por cursor (keyset) sobre (columna de orden, id)
+        if cursor_key:
+            value, last_id = cursor_key
+            if column is None:
+                key, bound = Product.id, last_id
+            else:
+                key, bound = tuple_(column, Product.id), tuple_(value, last_id)
+            query = query.filter(key < bound if descending else key > bound)
+
+        order = [Product.id] if column is None else [column, Product.id]
+        query = query.order_by(*[c.desc() if descending else c.asc() for c in order])
+
+        # Pedir un elemento extra para saber si hay una página siguiente
+        return query.limit(limit + 1).all()
+
+    async def load_page():
+        products = await run_db(db, list_products)
+        next_cursor = None
+        if len(products) > limit:
+            products = products[:limit]
+            next_cursor = encode_cursor(sort, products[-1])
+
+        return serialize(
+            {"items": product_dicts(products), "next_cursor": next_cursor, "limit": limit}
+        )
+
+    key = ("list", limit, cursor, sort, min_price, max_price, in_stock, name_prefix)
+    return conditional_response(request, await cached(key, load_page))
+
+
+@router.get("/featured", response_model=List[ProductResponse])
+async def get_featured_products(
+    request: Request,
+    limit: int = Query(4, ge=1, le=24),
+    ranking: FeaturedRanking = FeaturedRanking.newest,
+    db: DbSession = Depends(get_read_db),
+):
+    def top_products(db: Session):
+        # Solo productos con stock, servido por idx_products_in_stock / price_id
+        column, descending = FEATURED_RANKINGS[ranking]
+        order = [column, Product.id]
+        products = (
+            db.query(*PRODUCT_COLUMNS)
+            .filter(Product.stock > 0)
+            .order_by(*[c.desc() if descending else c.asc() for c in order])
+            .limit(limit)
+            .all()
+        )
+        return serialize(product_dicts(products))
+
+    async def load():
+        return await run_db(db, top_products)
+
+    payload = await cached(("featured", ranking, limit), load)
+    return conditional_response(request, payload)
+
+
+def search_terms(q: str) -> List[str]:
+    return SEARCH_WORD.findall(q.lower())[:MAX_SEARCH_TERMS]
+
+
+def prefix_tsquery(terms: List[str]):
+    # La última palabra se busca como prefijo para resultados mientras se escribe
+    return func.to_tsquery(
+        "spanish", " & ".join(terms[:-1] + [terms[-1] + ":*"])
+    )
+
+
+@router.get("/search", response_model=ProductSearchPage)
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=255),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: DbSession = Depends(get_read_db),
+):
+    terms = search_terms(q)
+    normalized = " ".join(terms)
+
+    def run_search(db: Session):
+        tsquery = prefix_tsquery(terms)
+        # Coincidencia de texto completo (idx_products_search) o nombre parecido
+        # por trigramas (idx_products_name_trgm) para tolerar errores de tipeo
+        matches = Product.search_vector.op("@@")(tsquery) | literal(
+            normalized
+        ).op("<%")(Product.name)
+        rank = func.ts_rank_cd(Product.search_vector, tsquery) + func.word_similarity(
+            normalized, Product.name
+        )
+        return (
+            db.query(*PRODUCT_COLUMNS)
+            .filter(matches)
+            .order_by(rank.desc(), Product.id)
+            .offset(offset)
+            .limit(limit + 1)
+            .all()
+        )
+
+    async def load_results():
+        products = await run_db(db, run_search) if terms else []
+        next_offset = offset + limit if len(products) > limit else None
+        return serialize(
+            {
+                "items": product_dicts(products[:limit]),
+                "query": normalized,
+                "limit": limit,
+                "offset": offset,
+                "next_offset": next_offset,
+            }
+        )
+
+    payload = await cached(("search", normalized, limit, offset), load_results)
+    return conditional_response(request, payload)
+
+
+@router.get("/search/suggest", response_model=List[ProductSuggestion])
+async def suggest_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=255),
+    limit: int = Query(8, ge=1, le=20),
+    db: DbSession = Depends(get_read_db),
+):
+    terms = search_terms(q)
+    normalized = " ".join(terms)
+
+    def find_names(db: Session):
+        # Autocompletado: prefijo exacto del nombre o palabras parecidas
+        matches = func.lower(Product.name).startswith(
+            normalized, autoescape=True
+        ) | literal(normalized).op("<%")(Product.name)
+        products = (
+            db.query(Product.id, Product.name)
+            .filter(matches)
+            .order_by(
+                func.word_similarity(normalized, Product.name).desc(), Product.name
+            )
+            .limit(limit)
+            .all()
+        )
+        return serialize([{"id": pid, "name": name} for pid, name in products])
+
+    async def load():
+        if not terms:
+            return serialize([])
+        return await run_db(db, find_names)
+
+    payload = await cached(("suggest", normalized, limit), load)
+    return conditional_response(request, payload)
+
+
+@router.get("/export")
+async def export_products(
+    export_format: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+):
+    # Proyección de columnas recorrida con un cursor del servidor por lotes.
+    # Se exporta la existencia física (stock más lo reservado en pedidos
+    # pendientes), la misma que recibe la importación
+    reserved = pending_quantities()
+    columns = {field: getattr(Product, field) for field in bulk.EXPORT_FIELDS}
+    columns["stock"] = (Product.stock + func.coalesce(reserved.c.quantity, 0)).label(
+        "stock"
+    )
+    statement = (
+        select(*columns.values())
+        .outerjoin(reserved, reserved.c.product_id == Product.id)
+        .order_by(Product.id)
+    )
+    partitions = stream_rows(statement, bulk.EXPORT_BATCH_SIZE)
+    return StreamingResponse(
+        bulk.export_products(export_format.value, partitions),
+        media_type=bulk.MEDIA_TYPES[export_format.value],
+        headers={
+            "Content-Disposition": f'attachment; filename="productos.{export_format.value}"'
+        },
+    )
 
 
 @router.get("/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def get_product(
+    request: Request, product_id: int, db: DbSession = Depends(get_read_db)
+):
+    def load_product(db: Session):
+        product = db.query(*PRODUCT_COLUMNS).filter(Product.id == product_id).first()
+        return serialize(product_dicts([product])[0]) if product else None
+
+    async def load():
+        return await run_db(db, load_product)
 
-    if not product:
+    payload = await cached(("product", product_id), load)
+
+    if not payload:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado"
         )
 
-    return product
+    return conditional_response(request, payload)
+
+
+def commit_product(db: Session):
+    try:
+        db.commit()
+    except IntegrityError:
+        # La única restricción que el cliente puede violar es el SKU único
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="El SKU ya está registrado"
+        )
 
 
 @router.post("/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
-async def create_product(product_data: ProductCreate, db: Session = Depends(get_db)):
-    new_product = Product(
-        name=product_data.name,
-        description=product_data.description,
-        price=product_data.price,
-        stock=product_data.stock,
-        image_url=product_data.image_url,
-    )
+async def create_product(
+    product_data: ProductCreate, db: DbSession = Depends(get_db)
+):
+    def insert_product(db: Session):
+        new_product = Product(
+            sku=product_data.sku,
+            name=product_data.name,
+            description=product_data.description,
+            price=product_data.price,
+            stock=product_data.stock,
+            image_url=product_data.image_url,
+        )
+
+        db.add(new_product)
+        notify_catalog_change(db)
+        commit_product(db)
+        db.refresh(new_product)
 
-    db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
+        return new_product
+
+    new_product = await run_db(db, insert_product)
+    invalidate_catalog()
+    edge_cache.refresh_catalog(new_product.id)
 
     return new_product
 
 
 @router.put("/{product_id}", response_model=ProductResponse)
 async def update_product(
-    product_id: int, product_data: ProductUpdate, db: Session = Depends(get_db)
+    product_id: int, product_data: ProductUpdate, db: DbSession = Depends(get_db)
 ):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    def apply_update(db: Session):
+        update_data = product_data.model_dump(exclude_unset=True)
+        query = db.query(Product).filter(Product.id == product_id)
+        if update_data.get("stock") is not None:
+            # Mismo lock que las reservas: ninguna puede cambiar hasta el commit
+            query = query.with_for_update(key_share=True)
+        product = query.first()
 
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado"
-        )
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado"
+            )
+
+        if update_data.get("stock") is not None:
+            reserved = reserved_stock(db, [product_id]).get(product_id, 0)
+            if update_data["stock"] < reserved:
+                db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Hay {reserved} unidades reservadas en pedidos pendientes",
+                )
+            update_data["stock"] -= reserved
+
+        # Actualizar solo los campos proporcionados
+        for field, value in update_data.items():
+            setattr(product, field, value)
+
+        notify_catalog_change(db)
+        commit_product(db)
+        db.refresh(product)
 
-    # Actualizar solo los campos proporcionados
-    update_data = product_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(product, field, value)
+        return product
 
-    db.commit()
-    db.refresh(product)
+    product = await run_db(db, apply_update)
+    invalidate_catalog()
+    edge_cache.refresh_catalog(product_id)
 
     return product
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def delete_product(product_id: int, db: DbSession = Depends(get_db)):
+    def remove_product(db: Session):
+        product = db.query(Product).filter(Product.id == product_id).first()
 
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado"
-        )
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado"
+            )
 
-    db.delete(product)
-    db.commit()
+        db.delete(product)
+        notify_catalog_change(db)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Los items de pedidos conservan la referencia al producto
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="El producto tiene pedidos asociados",
+            )
+
+    await run_db(db, remove_product)
+    invalidate_catalog()
+    edge_cache.refresh_catalog(product_id)
 
     return None
+
+
+@router.post("/bulk")
+async def bulk_import_products(request: Request, db: DbSession = Depends(get_db)):
+    # El cuerpo (CSV con encabezado o NDJSON) se procesa mientras se recibe
+    format = bulk.request_format(request.headers.get("content-type", ""))
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Formato no soportado, use text/csv o application/x-ndjson",
+        )
+
+    return await bulk.import_products(db, format, request.stream())
@@ -1,21 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel, EmailStr
-import bcrypt
-from database import get_db
+from database import DbSession, get_db, get_read_db, run_db
 from models.user import User
+from security import (
+    CurrentUser,
+    create_session_tokens,
+    decode_token,
+    get_current_user,
+    hash_password_async,
+    needs_rehash,
+    verify_password_async,
+)
 
 router = APIRouter()
 
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
-
-
 class UserCreate(BaseModel):
     username: str
     email: EmailStr
@@ -27,6 +28,10 @@ class UserLogin(BaseModel):
     password: str
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class UserResponse(BaseModel):
     id: int
     username: str
@@ -40,41 +45,62 @@ class UserResponse(BaseModel):
 @router.post(
     "/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED
 )
-async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
-    # Verificar si el usuario ya existe
-    existing_user = (
-        db.query(User)
-        .filter((User.username == user_data.username) | (User.email == user_data.email))
-        .first()
-    )
+async def register_user(user_data: UserCreate, db: DbSession = Depends(get_db)):
+    def find_existing(db: Session):
+        return (
+            db.query(User.id)
+            .filter(
+                (User.username == user_data.username) | (User.email == user_data.email)
+            )
+            .first()
+        )
 
-    if existing_user:
+    # Verificar si el usuario ya existe
+    if await run_db(db, find_existing):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El usuario o email ya está registrado",
         )
 
-    # Crear el usuario
-    hashed_password = hash_password(user_data.password)
-    new_user = User(
-        username=user_data.username,
-        email=user_data.email,
-        password_hash=hashed_password,
-    )
+    # El hash se calcula en el pool de bcrypt, fuera del event loop
+    hashed_password = await hash_password_async(user_data.password)
 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    def create_user(db: Session):
+        # Crear el usuario
+        new_user = User(
+            username=user_data.username,
+            email=user_data.email,
+            password_hash=hashed_password,
+        )
 
-    return new_user
+        db.add(new_user)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Otro registro concurrente tomó el mismo username o email
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El usuario o email ya está registrado",
+            )
+        db.refresh(new_user)
+
+        return new_user
+
+    return await run_db(db, create_user)
 
 
 @router.post("/login")
-async def login_user(credentials: UserLogin, db: Session = Depends(get_db)):
-    # Buscar usuario
-    user = db.query(User).filter(User.username == credentials.username).first()
+async def login_user(credentials: UserLogin, db: DbSession = Depends(get_db)):
+    def find_user(db: Session):
+        # Buscar usuario
+        return db.query(User).filter(User.username == credentials.username).first()
+
+    user = await run_db(db, find_user)
 
-    if not user or not verify_password(credentials.password, user.password_hash):
+    if not user or not await verify_password_async(
+        credentials.password, user.password_hash
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales incorrectas"
         )
@@ -84,15 +110,57 @@ async def login_user(credentials: UserLogin, db: Session = Depends(get_db)):
             status_code=status.HTTP_403_FORBIDDEN, detail="Usuario inactivo"
         )
 
+    # Regenerar el hash si el costo de bcrypt configurado cambió
+    if needs_rehash(user.password_hash):
+        new_hash = await hash_password_async(credentials.password)
+
+        def store_hash(db: Session):
+            db.query(User).filter(User.id == user.id).update(
+                {User.password_hash: new_hash}, synchronize_session=False
+            )
+            db.commit()
+
+        await run_db(db, store_hash)
+
     return {
         "message": "Login exitoso",
         "user": {"id": user.id, "username": user.username, "email": user.email},
+        **create_session_tokens(user),
     }
 
 
+@router.post("/refresh")
+async def refresh_session(data: RefreshRequest, db: DbSession = Depends(get_db)):
+    payload = decode_token(data.refresh_token, "refresh")
+
+    def find_user(db: Session):
+        return db.query(User).filter(User.id == int(payload["sub"])).first()
+
+    # Única lectura de users mientras dura la sesión: se renuevan los datos
+    # del token y se corta el acceso a usuarios eliminados o inactivos
+    user = await run_db(db, find_user)
+
+    if not user or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido o expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return create_session_tokens(user)
+
+
 @router.get("/profile", response_model=UserResponse)
-async def get_user_profile(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user_profile(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_read_db),
+):
+    user_id = current_user.id
+
+    def load_user(db: Session):
+        return db.query(User).filter(User.id == user_id).first()
+
+    user = await run_db(db, load_user)
 
     if not user:
         raise HTTPException(
@@ -104,43 +172,50 @@ async def get_user_profile(user_id: int, db: Session = Depends(get_db)):
 
 @router.put("/profile", response_model=UserResponse)
 async def update_user_profile(
-    user_id: int,
     username: str = None,
     email: EmailStr = None,
-    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: DbSession = Depends(get_db),
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user_id = current_user.id
 
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado"
-        )
+    def apply_update(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
 
-    if username:
-        # Verificar que el nuevo username no esté en uso
-        existing = (
-            db.query(User).filter(User.username == username, User.id != user_id).first()
-        )
-        if existing:
+        if not user:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El nombre de usuario ya está en uso",
+                status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado"
             )
-        user.username = username
 
-    if email:
-        # Verificar que el nuevo email no esté en uso
-        existing = (
-            db.query(User).filter(User.email == email, User.id != user_id).first()
-        )
-        if existing:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El email ya está en uso",
+        if username:
+            # Verificar que el nuevo username no esté en uso
+            existing = (
+                db.query(User)
+                .filter(User.username == username, User.id != user_id)
+                .first()
+            )
+            if existing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="El nombre de usuario ya está en uso",
+                )
+            user.username = username
+
+        if email:
+            # Verificar que el nuevo email no esté en uso
+            existing = (
+                db.query(User).filter(User.email == email, User.id != user_id).first()
             )
-        user.email = email
+            if existing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="El email ya está en uso",
+                )
+            user.email = email
 
-    db.commit()
-    db.refresh(user)
+        db.commit()
+        db.refresh(user)
 
-    return user
+        return user
+
+    return await run_db(db, apply_update)
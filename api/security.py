@@ -0,0 +1,206 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fastapi import Depends, Header, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from typing import NamedTuple, Optional
+import asyncio
+import bcrypt
+import hmac
+import os
+
+# Costo de bcrypt para los hashes nuevos; los existentes con otro costo se
+# vuelven a generar en el siguiente login exitoso
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Pool donde se ejecuta bcrypt para no congelar el event loop:
+# - "thread": bcrypt libera el GIL, suficiente en la mayoría de los casos
+# - "process": aísla el CPU de bcrypt del proceso que atiende requests
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread").lower()
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+# Máximo de operaciones esperando un worker antes de responder 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Tokens de sesión firmados (JWT): el acceso es corto y se renueva con el de
+# refresco, así cada request se autentica sin consultar la tabla users. Sin
+# valor por defecto: una clave publicada permitiría firmar tokens de cualquiera
+SECRET_KEY = os.getenv("SECRET_KEY", "")
+if not SECRET_KEY:
+    raise RuntimeError(
+        "SECRET_KEY no está definida; genera una con: "
+        'python -c "import secrets; print(secrets.token_urlsafe(32))"'
+    )
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+# Credencial de los endpoints internos (tareas y reportes que ven datos de
+# todos los usuarios). Vacía = esos endpoints quedan deshabilitados
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+_executor: Optional[Executor] = None
+_in_flight = 0
+_completed = 0
+_rejected = 0
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode(
+        "utf-8"
+    )
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def needs_rehash(hashed: str) -> bool:
+    # Formato bcrypt: $2b$<costo>$<salt+hash>
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+            )
+    return _executor
+
+
+async def run_in_pool(fn, *args):
+    """Ejecuta fn en el pool de bcrypt respetando el límite de la cola"""
+    global _in_flight, _completed, _rejected
+
+    if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        _rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio ocupado, intenta de nuevo en unos segundos",
+        )
+
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+        _completed += 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await run_in_pool(hash_password, password, BCRYPT_ROUNDS)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await run_in_pool(verify_password, password, hashed)
+
+
+def stats() -> dict:
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "rounds": BCRYPT_ROUNDS,
+        "in_flight": _in_flight,
+        "queue_depth": max(0, _in_flight - PASSWORD_HASH_WORKERS),
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "completed": _completed,
+        "rejected": _rejected,
+    }
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
+    email: str
+
+
+def create_token(claims: dict, token_type: str, expires: timedelta) -> str:
+    now = datetime.now(timezone.utc)
+    payload = {**claims, "type": token_type, "iat": now, "exp": now + expires}
+    return jwt.encode(payload, SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def create_session_tokens(user) -> dict:
+    """Par de tokens de acceso y refresco para un usuario autenticado"""
+    access_token = create_token(
+        {"sub": str(user.id), "username": user.username, "email": user.email},
+        "access",
+        timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    refresh_token = create_token(
+        {"sub": str(user.id)}, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+def decode_token(token: str, token_type: str) -> dict:
+    """Valida firma, expiración y tipo del token; 401 si no es válido"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except JWTError:
+        payload = None
+    if (
+        not payload
+        or payload.get("type") != token_type
+        or not str(payload.get("sub", "")).isdigit()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido o expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
+
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> CurrentUser:
+    """Usuario autenticado a partir del token de acceso, sin consultar la base"""
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No autenticado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    payload = decode_token(credentials.credentials, "access")
+    return CurrentUser(
+        int(payload["sub"]), payload.get("username", ""), payload.get("email", "")
+    )
+
+
+async def require_internal_token(
+    x_internal_token: Optional[str] = Header(None),
+):
+    """Solo servicios internos con INTERNAL_API_TOKEN; 403 para cualquier otro"""
+    if not (
+        INTERNAL_API_TOKEN
+        and x_internal_token
+        and hmac.compare_digest(x_internal_token, INTERNAL_API_TOKEN)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acceso restringido a servicios internos",
+        )
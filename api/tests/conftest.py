@@ -0,0 +1,18 @@
+import os
+import sys
+
+# Los módulos de la API se importan como en el contenedor (desde api/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# La API no arranca sin clave para firmar los tokens
+os.environ.setdefault("SECRET_KEY", "clave-de-prueba")
+
+# Con TEST_DATABASE_URL la API de los tests usa esa base en modo sync (las
+# consultas pasan por el engine síncrono, donde se registran) y sin réplicas
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    os.environ["DB_MODE"] = "sync"
+    os.environ["DATABASE_REPLICA_URLS"] = ""
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    os.environ.setdefault("INTERNAL_API_TOKEN", "token-interno-de-prueba")
@@ -0,0 +1,41 @@
+"""Los endpoints internos rechazan a los clientes sin la credencial interna.
+
+No necesitan base de datos: la credencial se valida antes de abrir la sesión.
+"""
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi.testclient import TestClient
+import security
+from main import app
+
+ABANDONED = "/api/v1/carts/abandoned"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(security, "INTERNAL_API_TOKEN", "token-interno")
+    return TestClient(app)
+
+
+def test_abandoned_carts_rejects_anonymous(client):
+    assert client.get(ABANDONED).status_code == 403
+
+
+def test_abandoned_carts_rejects_user_token(client):
+    user = security.CurrentUser(1, "cliente", "cliente@example.com")
+    token = security.create_session_tokens(user)["access_token"]
+    response = client.get(ABANDONED, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+def test_abandoned_carts_rejects_wrong_internal_token(client):
+    response = client.get(ABANDONED, headers={"X-Internal-Token": "otro-token"})
+    assert response.status_code == 403
+
+
+def test_abandoned_carts_disabled_without_configured_token(client, monkeypatch):
+    monkeypatch.setattr(security, "INTERNAL_API_TOKEN", "")
+    response = client.get(ABANDONED, headers={"X-Internal-Token": ""})
+    assert response.status_code == 403
@@ -0,0 +1,187 @@
+"""Utilidades compartidas por los benchmarks: latencias, reportes y comparación"""
+
+import json
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+
+def latency_summary(values) -> dict:
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": percentile(values, 1.0),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(args) -> dict:
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "args": vars(args),
+    }
+
+
+class Recorder:
+    """Latencias y códigos de estado por endpoint.
+
+    Los endpoints se agrupan por nombre de ruta ("GET /api/v1/products/{id}")
+    y no por URL concreta. Solo se registra mientras measuring es True, para
+    dejar fuera el calentamiento.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.measuring = False
+        self.started = None
+        self.elapsed = None
+
+    def start(self):
+        self.measuring = True
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.measuring = False
+        self.elapsed = time.perf_counter() - self.started
+
+    async def request(self, client, name, method, url, expected=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            if self.measuring:
+                self.latencies[name].append(time.perf_counter() - started)
+                self.statuses[name][type(e).__name__] += 1
+            return None
+        if self.measuring:
+            self.latencies[name].append(time.perf_counter() - started)
+            self.statuses[name][str(response.status_code)] += 1
+            if expected is not None and response.status_code not in expected:
+                self.statuses[name]["unexpected"] += 1
+        return response
+
+    def summary(self) -> dict:
+        endpoints = {}
+        for name in sorted(self.latencies):
+            statuses = Counter(self.statuses[name])
+            unexpected = statuses.pop("unexpected", 0)
+            errors = unexpected + sum(
+                count
+                for status, count in statuses.items()
+                if not status.isdigit() or int(status) >= 500
+            )
+            endpoints[name] = {
+                "requests": len(self.latencies[name]),
+                "requests_per_second": round(len(self.latencies[name]) / self.elapsed, 1),
+                "errors": errors,
+                "statuses": dict(statuses),
+                "latency_ms": latency_summary(self.latencies[name]),
+            }
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        return {
+            "elapsed_seconds": round(self.elapsed, 3),
+            "total": {
+                "requests": len(all_latencies),
+                "requests_per_second": round(len(all_latencies) / self.elapsed, 1),
+                "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+                "latency_ms": latency_summary(all_latencies),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def format_table(summary: dict) -> str:
+    rows = [("endpoint", "req", "req/s", "err", "p50", "p95", "p99")]
+    for name, endpoint in [*summary["endpoints"].items(), ("TOTAL", summary["total"])]:
+        latency = endpoint["latency_ms"]
+        rows.append(
+            (
+                name,
+                str(endpoint["requests"]),
+                str(endpoint["requests_per_second"]),
+                str(endpoint["errors"]),
+                str(latency["p50"]),
+                str(latency["p95"]),
+                str(latency["p99"]),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(
+            value.ljust(width) if i == 0 else value.rjust(width)
+            for i, (value, width) in enumerate(zip(row, widths))
+        )
+        for row in rows
+    )
+
+
+def compare(baseline: dict, current: dict, tolerance: float):
+    """Compara dos resultados de load.py por endpoint.
+
+    Devuelve (líneas del reporte, regresiones). Es regresión que el p95 suba o
+    que el throughput baje más que tolerance (fracción, 0.2 = 20 %), o que
+    aparezcan errores donde no los había.
+    """
+    lines = []
+    regressions = []
+    names = [*current["endpoints"], "TOTAL"]
+    for name in names:
+        before = baseline["total"] if name == "TOTAL" else baseline["endpoints"].get(name)
+        after = current["total"] if name == "TOTAL" else current["endpoints"][name]
+        if before is None:
+            lines.append(f"{name}: sin datos en la línea base")
+            continue
+
+        p95_before = before["latency_ms"]["p95"] or 0
+        p95_after = after["latency_ms"]["p95"] or 0
+        rps_before = before["requests_per_second"]
+        rps_after = after["requests_per_second"]
+        p95_change = (p95_after - p95_before) / p95_before if p95_before else 0
+        rps_change = (rps_after - rps_before) / rps_before if rps_before else 0
+
+        problems = []
+        if p95_change > tolerance:
+            problems.append("p95")
+        if rps_change < -tolerance:
+            problems.append("throughput")
+        if after["errors"] and not before["errors"]:
+            problems.append("errores")
+        if problems:
+            regressions.append((name, problems))
+
+        lines.append(
+            f"{name}: p95 {p95_before} -> {p95_after} ms ({p95_change:+.0%}), "
+            f"req/s {rps_before} -> {rps_after} ({rps_change:+.0%})"
+            + (f"  REGRESIÓN: {', '.join(problems)}" if problems else "")
+        )
+    return lines, regressions
+
+
+def load_result(path: str) -> dict:
+    with open(path) as result:
+        return json.load(result)
@@ -0,0 +1,28 @@
+"""Compara dos resultados guardados por load.py y marca las regresiones.
+
+Uso:
+    python benchmarks/compare.py results/base.json results/nuevo.json --tolerance 0.2
+"""
+
+import argparse
+import sys
+
+from common import compare, load_result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    lines, regressions = compare(
+        load_result(args.baseline), load_result(args.current), args.tolerance
+    )
+    print("\n".join(lines))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
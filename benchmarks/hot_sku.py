@@ -0,0 +1,153 @@
+"""Benchmark de checkout concurrente sobre un único producto (hot SKU).
+
+Crea un producto con --stock unidades y --buyers compradores con una unidad
+en el carrito cada uno, y lanza todos los checkouts a la vez contra la API.
+Reporta throughput y latencias y verifica que no haya sobreventa: deben
+confirmarse exactamente min(stock, buyers) pedidos y el stock final no puede
+ser negativo.
+
+Uso:
+    python benchmarks/hot_sku.py --buyers 200 --stock 50
+
+Por defecto va contra el proxy de docker-compose (puerto 80).
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from common import latency_summary, run_metadata
+
+
+async def create_buyer(client, run_id, index, semaphore):
+    username = f"hot_{run_id}_{index}"
+    async with semaphore:
+        await client.post(
+            "/api/v1/users/register",
+            json={
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": "benchmark",
+            },
+        )
+        response = await client.post(
+            "/api/v1/users/login",
+            json={"username": username, "password": "benchmark"},
+        )
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def checkout(client, headers, start_event):
+    await start_event.wait()
+    started = time.perf_counter()
+    response = await client.post("/api/v1/orders/checkout", headers=headers)
+    return response.status_code, time.perf_counter() - started
+
+
+async def run(args):
+    run_id = int(time.time())
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.api_url, limits=limits, timeout=args.timeout
+    ) as client:
+        response = await client.post(
+            "/api/v1/products/",
+            json={
+                "sku": f"HOT-{run_id}",
+                "name": f"Producto en oferta {run_id}",
+                "price": "9.99",
+                "stock": args.stock,
+            },
+        )
+        response.raise_for_status()
+        product_id = response.json()["id"]
+
+        # Preparación: usuarios y carritos (no entra en la medición)
+        semaphore = asyncio.Semaphore(args.setup_concurrency)
+        buyers = await asyncio.gather(
+            *[create_buyer(client, run_id, i, semaphore) for i in range(args.buyers)]
+        )
+        for headers in buyers:
+            response = await client.post(
+                "/api/v1/carts/items",
+                json={"product_id": product_id, "quantity": 1},
+                headers=headers,
+            )
+            response.raise_for_status()
+
+        # Todos los compradores intentan pagar al mismo tiempo
+        start_event = asyncio.Event()
+        tasks = [
+            asyncio.create_task(checkout(client, headers, start_event))
+            for headers in buyers
+        ]
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        start_event.set()
+        results = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        # X-Read-Primary-Until: el stock final se lee del primario, sin pasar
+        # por la micro-caché del proxy ni por una réplica atrasada
+        response = await client.get(
+            f"/api/v1/products/{product_id}",
+            headers={"X-Read-Primary-Until": f"{time.time() + 5:.3f}"},
+        )
+        final_stock = response.json()["stock"]
+
+    statuses = {}
+    for status_code, _ in results:
+        statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+    latencies = [latency for _, latency in results]
+    confirmed = statuses.get("201", 0)
+    expected = min(args.stock, args.buyers)
+
+    summary = {
+        "meta": run_metadata(args),
+        "product_id": product_id,
+        "buyers": args.buyers,
+        "initial_stock": args.stock,
+        "confirmed_orders": confirmed,
+        "final_stock": final_stock,
+        "statuses": statuses,
+        "elapsed_seconds": round(elapsed, 3),
+        "checkouts_per_second": round(len(results) / elapsed, 1),
+        "latency_ms": latency_summary(latencies),
+        "oversold": confirmed > args.stock or final_stock < 0,
+        "consistent": confirmed == expected
+        and final_stock == args.stock - confirmed,
+    }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default="http://localhost")
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument(
+        "--concurrency", type=int, default=200, help="Conexiones simultáneas"
+    )
+    parser.add_argument("--setup-concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="Archivo donde guardar el resultado JSON")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+
+    # Código de salida distinto de cero ante sobreventa o conteos incoherentes
+    sys.exit(0 if summary["consistent"] and not summary["oversold"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Benchmark de carga de la API y la webapp con recorridos de usuario reales.
+
+Cada usuario virtual abre una sesión (login), repite --iterations recorridos
+de navegación y carrito, y vuelve a empezar hasta que termina --duration.
+Los recorridos son los de webapp/app.py (inicio, catálogo, búsqueda, agregar
+al carrito, ver y vaciar el carrito) y los mismos pasos contra la API. Los
+endpoints se miden en lazo cerrado, sin pausas salvo --think-time.
+
+Antes de medir se cargan productos de prueba (SKU BENCH-*) mediante la
+importación masiva si el catálogo tiene menos de --products, y se registran
+los usuarios; nada de eso entra en la medición, como tampoco el
+calentamiento (--warmup).
+
+Uso:
+    python benchmarks/load.py --users 50 --duration 60 --output results/base.json
+    python benchmarks/load.py --users 50 --duration 60 --baseline results/base.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+
+from common import Recorder, compare, format_table, load_result, run_metadata
+
+PASSWORD = "benchmark"
+PAGE_SIZE = 100
+
+
+async def seed_products(client, count, imported=False):
+    """Ids de al menos count productos, importando los que falten"""
+    product_ids, names = [], []
+    cursor = None
+    while len(product_ids) < count:
+        params = {"limit": PAGE_SIZE, "in_stock": "true"}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/api/v1/products/", params=params)
+        response.raise_for_status()
+        page = response.json()
+        product_ids += [product["id"] for product in page["items"]]
+        names += [product["name"] for product in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    if len(product_ids) < count and not imported:
+        words = ["Teclado", "Mouse", "Monitor", "Cable", "Parlante", "Cámara"]
+        rows = ["sku,name,description,price,stock"]
+        for i in range(count):
+            word = words[i % len(words)]
+            rows.append(
+                f"BENCH-{i:06d},{word} de prueba {i},"
+                f"Producto generado para benchmarks,{10 + i % 90}.99,1000000"
+            )
+        response = await client.post(
+            "/api/v1/products/bulk",
+            content="\n".join(rows) + "\n",
+            headers={"Content-Type": "text/csv"},
+        )
+        response.raise_for_status()
+        return await seed_products(client, count, imported=True)
+
+    return product_ids[:count], names[:count]
+
+
+def search_terms(names):
+    terms = {word.lower() for name in names for word in name.split() if len(word) > 3}
+    return sorted(terms) or ["producto"]
+
+
+async def register_user(client, username, semaphore):
+    async with semaphore:
+        response = await client.post(
+            "/api/v1/users/register",
+            json={
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": PASSWORD,
+            },
+        )
+        # 400: el usuario ya existe de una corrida anterior
+        if response.status_code not in (201, 400):
+            response.raise_for_status()
+
+
+async def api_session(recorder, client, username, catalog, deadline, args, rng):
+    response = await recorder.request(
+        client,
+        "POST /api/v1/users/login",
+        "POST",
+        "/api/v1/users/login",
+        expected={200},
+        json={"username": username, "password": PASSWORD},
+    )
+    if response is None or response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    product_ids, terms = catalog
+
+    for _ in range(args.iterations):
+        if time.perf_counter() >= deadline:
+            break
+        product_id = rng.choice(product_ids)
+        steps = [
+            ("GET /api/v1/products/", "GET", "/api/v1/products/", {"params": {"limit": 20}}),
+            ("GET /api/v1/products/featured", "GET", "/api/v1/products/featured", {}),
+            (
+                "GET /api/v1/products/search",
+                "GET",
+                "/api/v1/products/search",
+                {"params": {"q": rng.choice(terms)}},
+            ),
+            ("GET /api/v1/products/{id}", "GET", f"/api/v1/products/{product_id}", {}),
+            (
+                "POST /api/v1/carts/items",
+                "POST",
+                "/api/v1/carts/items",
+                {"json": {"product_id": product_id, "quantity": 1}, "headers": headers},
+            ),
+            ("GET /api/v1/carts/", "GET", "/api/v1/carts/", {"headers": headers}),
+            ("DELETE /api/v1/carts/", "DELETE", "/api/v1/carts/", {"headers": headers}),
+        ]
+        for name, method, url, kwargs in steps:
+            await recorder.request(
+                client, name, method, url, expected=range(200, 300), **kwargs
+            )
+            await think(args, rng)
+
+
+async def web_session(recorder, client, username, catalog, deadline, args, rng):
+    # La webapp responde con redirecciones: 302 es el resultado esperado
+    ok = range(200, 400)
+    response = await recorder.request(
+        client,
+        "POST /login",
+        "POST",
+        "/login",
+        expected={302},
+        data={"username": username, "password": PASSWORD},
+    )
+    if response is None or response.status_code != 302:
+        return
+    product_ids, terms = catalog
+
+    for _ in range(args.iterations):
+        if time.perf_counter() >= deadline:
+            break
+        product_id = rng.choice(product_ids)
+        steps = [
+            ("GET /", "GET", "/", {}),
+            ("GET /products", "GET", "/products", {}),
+            ("GET /products?q=", "GET", "/products", {"params": {"q": rng.choice(terms)}}),
+            (
+                "POST /add-to-cart/{id}",
+                "POST",
+                f"/add-to-cart/{product_id}",
+                {"data": {"quantity": "1"}},
+            ),
+            ("GET /cart", "GET", "/cart", {}),
+            ("POST /clear-cart", "POST", "/clear-cart", {}),
+        ]
+        for name, method, url, kwargs in steps:
+            await recorder.request(client, name, method, url, expected=ok, **kwargs)
+            await think(args, rng)
+
+    await recorder.request(client, "GET /logout", "GET", "/logout", expected=ok)
+
+
+async def think(args, rng):
+    if args.think_time:
+        await asyncio.sleep(rng.uniform(0, args.think_time))
+
+
+async def virtual_user(index, recorder, deadline, catalog, args, limits):
+    rng = random.Random(args.seed + index)
+    username = f"bench_{args.run_id}_{index}"
+    web = args.scenario == "web" or (args.scenario == "mixed" and index % 2)
+    session = web_session if web else api_session
+    base_url = args.web_url if web else args.api_url
+
+    # Un cliente por usuario: la webapp guarda la sesión en una cookie
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        while time.perf_counter() < deadline:
+            await session(recorder, client, username, catalog, deadline, args, rng)
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=args.timeout) as client:
+        product_ids, names = await seed_products(client, args.products)
+        semaphore = asyncio.Semaphore(args.setup_concurrency)
+        await asyncio.gather(
+            *[
+                register_user(client, f"bench_{args.run_id}_{i}", semaphore)
+                for i in range(args.users)
+            ]
+        )
+
+    catalog = (product_ids, search_terms(names))
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+    started = time.perf_counter()
+    deadline = started + args.warmup + args.duration
+    users = [
+        asyncio.create_task(virtual_user(i, recorder, deadline, catalog, args, limits))
+        for i in range(args.users)
+    ]
+
+    await asyncio.sleep(args.warmup)
+    recorder.start()
+    await asyncio.sleep(max(0, deadline - time.perf_counter()))
+    recorder.stop()
+    # Las sesiones en curso terminan su paso actual sin registrarse
+    await asyncio.gather(*users)
+
+    return {"meta": run_metadata(args), **recorder.summary()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    # Por defecto, el proxy de docker-compose (único puerto publicado)
+    parser.add_argument("--api-url", default="http://localhost")
+    parser.add_argument("--web-url", default="http://localhost")
+    parser.add_argument(
+        "--scenario",
+        choices=["api", "web", "mixed"],
+        default="mixed",
+        help="Recorridos contra la API, la webapp o mitad y mitad",
+    )
+    parser.add_argument("--users", type=int, default=20, help="Usuarios virtuales")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos medidos")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument(
+        "--iterations", type=int, default=10, help="Recorridos por sesión (login)"
+    )
+    parser.add_argument("--think-time", type=float, default=0)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--setup-concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--run-id",
+        default="load",
+        help="Prefijo de los usuarios de prueba; se reutilizan entre corridas",
+    )
+    parser.add_argument("--output", help="Archivo donde guardar el resultado JSON")
+    parser.add_argument("--baseline", help="Resultado anterior con el cual comparar")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Variación admitida frente a la línea base (0.2 = 20 %%)",
+    )
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    print(format_table(summary))
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(json.dumps(summary, indent=2) + "\n")
+
+    if args.baseline:
+        lines, regressions = compare(load_result(args.baseline), summary, args.tolerance)
+        print()
+        print("\n".join(lines))
+        # Código de salida distinto de cero si alguna ruta empeoró
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
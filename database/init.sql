@@ -1,5 +1,7 @@
 -- Crear extensiones necesarias
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Similitud por trigramas para la búsqueda tolerante a errores de tipeo
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Configurar zona horaria
 SET timezone = 'America/Bogota';
@@ -0,0 +1,10 @@
+#!/bin/bash
+# Habilita la replicación en streaming en el primario. Corre solo al crear
+# el volumen de datos, como el resto de /docker-entrypoint-initdb.d
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    CREATE ROLE "$REPLICATION_USER" WITH REPLICATION LOGIN PASSWORD '$REPLICATION_PASSWORD';
+EOSQL
+
+echo "host replication $REPLICATION_USER all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,15 @@
+#!/bin/bash
+# Réplica en streaming: la primera vez copia el primario con pg_basebackup
+# (-R deja standby.signal y primary_conninfo) y luego arranca Postgres normal
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    until pg_isready -h "$PRIMARY_HOST" -U "$REPLICATION_USER"; do
+        sleep 1
+    done
+    PGPASSWORD="$REPLICATION_PASSWORD" pg_basebackup \
+        -h "$PRIMARY_HOST" -U "$REPLICATION_USER" -D "$PGDATA" -R -X stream
+    chmod 0700 "$PGDATA"
+fi
+
+exec docker-entrypoint.sh postgres
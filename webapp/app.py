@@ -1,18 +1,154 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import json
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlencode
 
 # Configurar la aplicación Flask
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "clave-por-defecto-cambiar")
 
+
+def load_static_manifest():
+    """Nombres con hash generados por build_static.py al construir la imagen"""
+    try:
+        with open(os.path.join(app.static_folder, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        # Sin build (desarrollo local) se usan los nombres originales
+        return {}
+
+
+static_manifest = load_static_manifest()
+
+
+@app.url_defaults
+def hashed_static_url(endpoint, values):
+    # url_for('static', filename='css/style.css') -> css/style.<hash>.css: la
+    # URL cambia con el contenido y nginx la puede servir como inmutable
+    if endpoint == "static" and "filename" in values:
+        values["filename"] = static_manifest.get(values["filename"], values["filename"])
+
+
 # Configurar la URL de la API
 API_URL = os.getenv("API_URL", "http://api:8000")
 
-
-def api_request(endpoint, method="GET", data=None, headers=None):
-    """Función helper para hacer requests a la API"""
+# Cantidad de productos por página en el catálogo
+PRODUCTS_PER_PAGE = int(os.getenv("PRODUCTS_PER_PAGE", "24"))
+
+# Productos destacados de la página principal
+FEATURED_PRODUCTS = int(os.getenv("FEATURED_PRODUCTS", "4"))
+
+# Datos del catálogo (iguales para todos los visitantes): segundos que están
+# frescos, hasta cuándo se sirven vencidos mientras se renuevan o mientras la
+# API no responde, y cantidad máxima de páginas guardadas
+CATALOG_PAGE_TTL = float(os.getenv("CATALOG_PAGE_TTL", "15"))
+CATALOG_PAGE_STALE = float(os.getenv("CATALOG_PAGE_STALE", "600"))
+CATALOG_PAGE_CACHE_SIZE = int(os.getenv("CATALOG_PAGE_CACHE_SIZE", "256"))
+
+
+# Cliente HTTP hacia la API: pool de conexiones keep-alive, timeouts y reintentos
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "2"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "10"))
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+API_RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", "0.2"))
+
+# Circuit breaker: fallos consecutivos para abrirlo y segundos antes de reintentar
+API_BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+API_BREAKER_RESET = float(os.getenv("API_BREAKER_RESET", "30"))
+
+SUPPORTED_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+
+
+def create_api_session():
+    """Sesión compartida entre hilos; urllib3 administra el pool de conexiones"""
+    # Se reintentan los errores de conexión y los 502/503/504, nunca un read
+    # timeout: la API pudo haber procesado el request y reintentarlo solo
+    # alarga la espera antes de que el breaker cuente el fallo. Solo métodos
+    # idempotentes; DELETE tampoco, su repetición respondería 404
+    retry = Retry(
+        total=API_RETRIES,
+        read=False,
+        backoff_factor=API_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "PUT", "OPTIONS"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=API_POOL_SIZE, max_retries=retry
+    )
+    http = requests.Session()
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+    return http
+
+
+class CircuitBreaker:
+    """Falla rápido mientras la API no responde en lugar de esperar el timeout"""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Semiabierto: deja pasar un intento y mantiene al resto fuera
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+api_session = create_api_session()
+api_breaker = CircuitBreaker(API_BREAKER_THRESHOLD, API_BREAKER_RESET)
+
+
+# Validadores (ETag) de las respuestas GET de la API para pedir solo cambios
+VALIDATOR_CACHE_SIZE = int(os.getenv("VALIDATOR_CACHE_SIZE", "512"))
+validator_cache = OrderedDict()
+validator_lock = threading.Lock()
+
+
+def api_request(
+    endpoint,
+    method="GET",
+    data=None,
+    headers=None,
+    retry_auth=True,
+    anonymous=False,
+    revalidate=True,
+):
+    """Función helper para hacer requests a la API.
+
+    Con anonymous=True no usa la sesión del visitante: sirve para datos
+    compartidos y puede llamarse fuera de un request (hilos de refresco).
+    Con revalidate=False los GET piden siempre la respuesta completa.
+    """
     url = f"{API_URL}{endpoint}"
     default_headers = {"Content-Type": "application/json"}
 
@@ -20,61 +156,296 @@ def api_request(endpoint, method="GET", data=None, headers=None):
         default_headers.update(headers)
 
     # Incluir cookies de sesión si existen
-    if "session_token" in session:
+    if not anonymous and "session_token" in session:
         default_headers["Authorization"] = f"Bearer {session.get('session_token')}"
 
+    # Después de una escritura propia la API pide leer del primario un rato
+    read_primary_until = None if anonymous else session.get("read_primary_until")
+    if read_primary_until and float(read_primary_until) > time.time():
+        default_headers["X-Read-Primary-Until"] = read_primary_until
+
+    # Revalidar con If-None-Match si ya tenemos una versión de esta respuesta
+    cache_key = (url, default_headers.get("Authorization"))
+    cached = None
+    if method == "GET" and revalidate:
+        with validator_lock:
+            cached = validator_cache.get(cache_key)
+        if cached:
+            default_headers["If-None-Match"] = cached[0]
+
+    if method not in SUPPORTED_METHODS:
+        return None, f"Método {method} no soportado"
+
+    if not api_breaker.allow():
+        return None, "La API no está disponible temporalmente"
+
     try:
-        if method == "GET":
-            response = requests.get(url, headers=default_headers, timeout=10)
-        elif method == "POST":
-            response = requests.post(
-                url, json=data, headers=default_headers, timeout=10
+        response = api_session.request(
+            method,
+            url,
+            json=data,
+            headers=default_headers,
+            timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT),
+        )
+    except requests.exceptions.RequestException as e:
+        api_breaker.record_failure()
+        return None, str(e)
+
+    if response.status_code >= 500:
+        api_breaker.record_failure()
+    else:
+        api_breaker.record_success()
+
+    if method == "GET":
+        remember_validator(cache_key, cached, response)
+        if response.status_code == 304 and revalidate:
+            # 304 sin una copia guardada con la que completarlo (p. ej. el
+            # If-None-Match lo puso el llamador): pedir la respuesta completa
+            # en vez de devolver un 304 sin cuerpo
+            headers = {
+                name: value
+                for name, value in (headers or {}).items()
+                if name.lower() != "if-none-match"
+            }
+            return api_request(
+                endpoint, method, data, headers, retry_auth, anonymous, revalidate=False
             )
-        elif method == "PUT":
-            response = requests.put(url, json=data, headers=default_headers, timeout=10)
-        elif method == "DELETE":
-            response = requests.delete(url, headers=default_headers, timeout=10)
-        else:
-            return None, f"Método {method} no soportado"
 
+    if anonymous:
         return response, None
-    except requests.exceptions.RequestException as e:
-        return None, str(e)
+
+    if "X-Read-Primary-Until" in response.headers:
+        session["read_primary_until"] = response.headers["X-Read-Primary-Until"]
+
+    # Token de acceso vencido: renovarlo con el de refresco y repetir una vez
+    if (
+        response.status_code == 401
+        and retry_auth
+        and "WWW-Authenticate" in response.headers
+    ):
+        refreshed, error = refresh_session_token()
+        if error:
+            return None, error
+        if refreshed:
+            return api_request(endpoint, method, data, headers, retry_auth=False)
+
+    return response, None
+
+
+def api_error_message(response, default):
+    """Mensaje de error de la API; en las validaciones (422) detail es una lista"""
+    try:
+        detail = response.json().get("detail", default)
+    except ValueError:
+        return default
+    if isinstance(detail, list):
+        messages = [
+            error["msg"] for error in detail if isinstance(error, dict) and "msg" in error
+        ]
+        return "; ".join(messages) or default
+    return detail
+
+
+def store_session_tokens(tokens):
+    session["session_token"] = tokens["access_token"]
+    session["refresh_token"] = tokens["refresh_token"]
+
+
+def refresh_session_token():
+    """Pedir un nuevo par de tokens; devuelve (renovado, error).
+
+    La sesión solo se cierra si la API rechaza el token de refresco (401).
+    Ante un error transitorio (API caída, circuit breaker abierto, 5xx) se
+    conservan los tokens para reintentar en el siguiente request.
+    """
+    refresh_token = session.get("refresh_token")
+    if not refresh_token:
+        return False, None
+
+    # Sin el token de acceso vencido: el de refresco va en el cuerpo
+    response, error = api_request(
+        "/api/v1/users/refresh",
+        method="POST",
+        data={"refresh_token": refresh_token},
+        anonymous=True,
+    )
+    if error:
+        return False, error
+    if response.status_code == 401:
+        session.clear()
+        return False, None
+    if response.status_code != 200:
+        return False, "No se pudo renovar la sesión, intenta de nuevo"
+
+    store_session_tokens(response.json())
+    return True, None
+
+
+def remember_validator(cache_key, cached, response):
+    """Guardar el ETag de la respuesta o reutilizar el cuerpo si fue un 304"""
+    if response.status_code == 304 and cached:
+        # La API confirmó que nuestra copia sigue vigente
+        response.status_code = 200
+        response._content = cached[1]
+        with validator_lock:
+            # Otro hilo pudo haberla desalojado mientras esperábamos la respuesta
+            if cache_key in validator_cache:
+                validator_cache.move_to_end(cache_key)
+    elif response.status_code == 200 and response.headers.get("ETag"):
+        with validator_lock:
+            validator_cache[cache_key] = (response.headers["ETag"], response.content)
+            validator_cache.move_to_end(cache_key)
+            while len(validator_cache) > VALIDATOR_CACHE_SIZE:
+                validator_cache.popitem(last=False)
+
+
+class PendingLoad:
+    """Carga en curso de una clave; los requests que llegan esperan su resultado"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = (None, "La API no respondió a tiempo")
+
+
+class StaleWhileRevalidateCache:
+    """Caché de datos de la API con stale-while-revalidate y un solo vuelo.
+
+    Una entrada vencida se sigue sirviendo mientras un único hilo la renueva
+    en segundo plano; si la API falla, la copia vieja sigue en uso hasta
+    max_stale. Sin copia utilizable, el primer request de cada clave consulta
+    la API y los demás esperan su resultado en lugar de repetir la llamada.
+    """
+
+    def __init__(self, maxsize, ttl, max_stale):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_stale = max_stale
+        # clave -> (valor, fresco hasta, utilizable hasta)
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.refresher = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="catalog-refresh"
+        )
+
+    def get(self, key, loader):
+        """Devuelve (valor, error); loader() devuelve lo mismo y None no se guarda"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now < entry[2]:
+                self.entries.move_to_end(key)
+                if now >= entry[1] and key not in self.pending:
+                    self.pending[key] = PendingLoad()
+                    self.refresher.submit(self.load, key, loader)
+                return entry[0], None
+            pending = self.pending.get(key)
+            if pending is None:
+                self.pending[key] = PendingLoad()
+
+        if pending is None:
+            return self.load(key, loader)
+        pending.done.wait(API_CONNECT_TIMEOUT + API_READ_TIMEOUT)
+        return pending.result
+
+    def load(self, key, loader):
+        try:
+            value, error = loader()
+        except Exception as e:
+            value, error = None, str(e)
+        now = time.monotonic()
+        with self.lock:
+            pending = self.pending.pop(key)
+            if value is not None and error is None:
+                # Vencimientos desfasados entre workers para que no coincidan
+                ttl = self.ttl * random.uniform(0.8, 1.0)
+                self.entries[key] = (value, now + ttl, now + self.max_stale)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            elif key in self.entries and now < self.entries[key][2]:
+                # Falló la renovación: se mantiene la copia anterior y no se
+                # reintenta hasta otro ttl para no insistir con la API caída
+                value, _, usable_until = self.entries[key]
+                self.entries[key] = (value, now + self.ttl, usable_until)
+                error = None
+        pending.result = (value, error)
+        pending.done.set()
+        return value, error
+
+
+catalog_cache = StaleWhileRevalidateCache(
+    CATALOG_PAGE_CACHE_SIZE, CATALOG_PAGE_TTL, CATALOG_PAGE_STALE
+)
+
+
+def fetch_catalog(endpoint):
+    """Loader de catalog_cache: la respuesta de la API sin datos del visitante"""
+    response, error = api_request(endpoint, anonymous=True)
+    if error:
+        return None, error
+    if response.status_code >= 500:
+        return None, f"La API respondió {response.status_code}"
+    if response.status_code != 200:
+        # Parámetros inválidos (cursor vencido, etc.): página vacía sin guardar
+        return None, None
+    return response.json(), None
 
 
 def is_logged_in():
     """Función para verificar si el usuario está logueado"""
-    return "user_id" in session and "username" in session
+    return "session_token" in session and "username" in session
 
 
 @app.route("/")
 def index():
     """Página principal"""
     # Obtener productos destacados de la API
-    response, error = api_request("/api/v1/products/")
+    products, error = get_featured_products()
 
     if error:
         flash(f"Error al conectar con la API: {error}", "danger")
-        products = []
-    else:
-        products = response.json() if response.status_code == 200 else []
 
-    return render_template("index.html", products=products[:4])
+    return render_template("index.html", products=products)
+
+
+def get_featured_products():
+    """Productos destacados de la API, compartidos entre visitantes"""
+    endpoint = f"/api/v1/products/featured?limit={FEATURED_PRODUCTS}"
+    products, error = catalog_cache.get(endpoint, lambda: fetch_catalog(endpoint))
+    return products or [], error
 
 
 @app.route("/products")
 def products():
     """Página de productos"""
-    # Obtener lista de productos de la API
-    response, error = api_request("/api/v1/products/")
+    query = request.args.get("q", "").strip()
+
+    # Obtener una página de productos (o de resultados de búsqueda) de la API
+    params = {"limit": PRODUCTS_PER_PAGE}
+    if query:
+        params["q"] = query
+        params["offset"] = request.args.get("offset", 0, type=int)
+        endpoint = f"/api/v1/products/search?{urlencode(params)}"
+    else:
+        if request.args.get("cursor"):
+            params["cursor"] = request.args["cursor"]
+        endpoint = f"/api/v1/products/?{urlencode(params)}"
+    page, error = catalog_cache.get(endpoint, lambda: fetch_catalog(endpoint))
 
+    products, next_page = [], None
     if error:
         flash(f"Error al conectar con la API: {error}", "danger")
-        products = []
-    else:
-        products = response.json() if response.status_code == 200 else []
-
-    return render_template("products.html", products=products)
+    elif page:
+        products = page["items"]
+        if query and page["next_offset"] is not None:
+            next_page = {"q": query, "offset": page["next_offset"]}
+        elif not query and page["next_cursor"]:
+            next_page = {"cursor": page["next_cursor"]}
+
+    return render_template(
+        "products.html", products=products, query=query, next_page=next_page
+    )
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -91,7 +462,9 @@ def login():
         if error:
             flash(f"Error de conexión: {error}", "danger")
         elif response.status_code == 200:
-            user_data = response.json().get("user", {})
+            login_data = response.json()
+            user_data = login_data.get("user", {})
+            store_session_tokens(login_data)
             session["user_id"] = user_data.get("id")
             session["username"] = user_data.get("username")
             session["email"] = user_data.get("email")
@@ -140,9 +513,8 @@ def cart():
         flash("Debes iniciar sesión para ver el carrito", "warning")
         return redirect(url_for("login"))
 
-    # Obtener carrito del usuario de la API
-    user_id = session.get("user_id")
-    response, error = api_request(f"/api/v1/carts/?user_id={user_id}")
+    # Obtener carrito del usuario de la API (identificado por el token)
+    response, error = api_request("/api/v1/carts/")
 
     if error:
         flash(f"Error al conectar con la API: {error}", "danger")
@@ -162,11 +534,10 @@ def add_to_cart(product_id):
         flash("Debes iniciar sesión para agregar al carrito", "warning")
         return redirect(url_for("login"))
 
-    user_id = session.get("user_id")
     quantity = int(request.form.get("quantity", 1))
 
     # Enviar request a la API
-    data = {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+    data = {"product_id": product_id, "quantity": quantity}
     response, error = api_request("/api/v1/carts/items", method="POST", data=data)
 
     if error:
@@ -204,6 +575,47 @@ def update_cart_item(item_id):
     return redirect(url_for("cart"))
 
 
+@app.route("/update-cart", methods=["POST"])
+def update_cart():
+    """Actualizar todas las cantidades del carrito en un solo request"""
+    if not is_logged_in():
+        flash("Debes iniciar sesión", "warning")
+        return redirect(url_for("login"))
+
+    # Campos quantity-<product_id> del formulario del carrito; los que no son
+    # números enteros no negativos (formulario alterado) se ignoran
+    operations = []
+    invalid = 0
+    for field, value in request.form.items():
+        if not field.startswith("quantity-"):
+            continue
+        product_id = field.split("-", 1)[1]
+        quantity = value.strip() or "0"
+        if not (product_id.isdecimal() and quantity.isdecimal()):
+            invalid += 1
+            continue
+        operations.append(
+            {"op": "set", "product_id": int(product_id), "quantity": int(quantity)}
+        )
+
+    if invalid:
+        flash("Se ignoraron cantidades no válidas", "warning")
+    if not operations:
+        return redirect(url_for("cart"))
+
+    data = {"operations": operations}
+    response, error = api_request("/api/v1/carts/", method="PATCH", data=data)
+
+    if error:
+        flash(f"Error de conexión: {error}", "danger")
+    elif response.status_code == 200:
+        flash("Carrito actualizado", "success")
+    else:
+        flash(api_error_message(response, "Error al actualizar"), "danger")
+
+    return redirect(url_for("cart"))
+
+
 @app.route("/remove-cart-item/<int:item_id>", methods=["POST"])
 def remove_cart_item(item_id):
     """Remover item del carrito"""
@@ -230,8 +642,7 @@ def clear_cart():
         flash("Debes iniciar sesión", "warning")
         return redirect(url_for("login"))
 
-    user_id = session.get("user_id")
-    response, error = api_request(f"/api/v1/carts/?user_id={user_id}", method="DELETE")
+    response, error = api_request("/api/v1/carts/", method="DELETE")
 
     if error:
         flash(f"Error de conexión: {error}", "danger")
@@ -241,6 +652,64 @@ def clear_cart():
     return redirect(url_for("cart"))
 
 
+@app.route("/checkout", methods=["POST"])
+def checkout():
+    """Crear un pedido con el contenido del carrito y reservar su stock"""
+    if not is_logged_in():
+        flash("Debes iniciar sesión", "warning")
+        return redirect(url_for("login"))
+
+    response, error = api_request("/api/v1/orders/checkout", method="POST")
+
+    if error:
+        flash(f"Error de conexión: {error}", "danger")
+    elif response.status_code == 201:
+        flash("Pedido creado, el stock queda reservado hasta el pago", "success")
+        return redirect(url_for("order", order_id=response.json()["id"]))
+    else:
+        flash(response.json().get("detail", "Error al crear el pedido"), "danger")
+
+    return redirect(url_for("cart"))
+
+
+@app.route("/orders/<int:order_id>")
+def order(order_id):
+    """Detalle de un pedido"""
+    if not is_logged_in():
+        flash("Debes iniciar sesión", "warning")
+        return redirect(url_for("login"))
+
+    response, error = api_request(f"/api/v1/orders/{order_id}")
+
+    if error:
+        flash(f"Error al conectar con la API: {error}", "danger")
+        return redirect(url_for("cart"))
+    if response.status_code != 200:
+        flash(response.json().get("detail", "Pedido no encontrado"), "danger")
+        return redirect(url_for("cart"))
+
+    return render_template("order.html", order=response.json())
+
+
+@app.route("/orders/<int:order_id>/<any(pay, cancel):action>", methods=["POST"])
+def update_order(order_id, action):
+    """Pagar o cancelar un pedido pendiente"""
+    if not is_logged_in():
+        flash("Debes iniciar sesión", "warning")
+        return redirect(url_for("login"))
+
+    response, error = api_request(f"/api/v1/orders/{order_id}/{action}", method="POST")
+
+    if error:
+        flash(f"Error de conexión: {error}", "danger")
+    elif response.status_code == 200:
+        flash("Pedido pagado" if action == "pay" else "Pedido cancelado", "success")
+    else:
+        flash(response.json().get("detail", "Error al actualizar el pedido"), "danger")
+
+    return redirect(url_for("order", order_id=order_id))
+
+
 @app.route("/logout")
 def logout():
     """Logout del usuario"""
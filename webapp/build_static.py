@@ -0,0 +1,104 @@
+"""Genera los estáticos con el hash del contenido en el nombre.
+
+css/style.css -> css/style.<hash>.css, más manifest.json con la tabla de
+nombres que app.py usa al resolver url_for('static', ...). Con --compress
+escribe además las variantes .gz y .br que nginx sirve precomprimidas.
+Se ejecuta al construir las imágenes; volver a correrlo reemplaza la salida
+anterior.
+
+    python build_static.py static --compress
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+MANIFEST = "manifest.json"
+HASH_LENGTH = 12
+COMPRESSIBLE = {".css", ".js", ".svg", ".txt", ".json", ".map"}
+
+
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def source_files(static_dir, generated):
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), static_dir)
+            path = path.replace(os.sep, "/")
+            if path == MANIFEST or path in generated or name.endswith((".gz", ".br")):
+                continue
+            yield path
+
+
+def hashed_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(path)
+    return f"{base}.{digest}{ext}"
+
+
+def remove_outputs(static_dir, paths):
+    for path in paths:
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(os.path.join(static_dir, path + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def write_compressed(target, content):
+    # mtime=0: la misma entrada produce siempre el mismo .gz
+    with open(target + ".gz", "wb") as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return False
+    with open(target + ".br", "wb") as f:
+        f.write(brotli.compress(content, quality=11))
+    return True
+
+
+def build(static_dir, compress=False):
+    previous = load_manifest(static_dir)
+    remove_outputs(static_dir, previous.values())
+
+    manifest = {}
+    brotli_missing = False
+    for path in sorted(source_files(static_dir, set(previous.values()))):
+        with open(os.path.join(static_dir, path), "rb") as f:
+            content = f.read()
+        manifest[path] = hashed_name(path, content)
+        target = os.path.join(static_dir, manifest[path])
+        with open(target, "wb") as f:
+            f.write(content)
+        if compress and os.path.splitext(path)[1] in COMPRESSIBLE:
+            brotli_missing |= not write_compressed(target, content)
+
+    with open(os.path.join(static_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli_missing:
+        print("brotli no está instalado: solo se generaron variantes .gz", file=sys.stderr)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("static_dir", nargs="?", default="static")
+    parser.add_argument(
+        "--compress", action="store_true", help="generar variantes .gz y .br"
+    )
+    args = parser.parse_args()
+    for path, hashed in build(args.static_dir, args.compress).items():
+        print(f"{path} -> {hashed}")
+
+
+if __name__ == "__main__":
+    main()
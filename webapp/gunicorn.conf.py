@@ -0,0 +1,39 @@
+# Configuración de Gunicorn para producción: workers con hilos (gthread)
+import multiprocessing
+import os
+
+
+def env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Procesos por núcleo y varios hilos por proceso: las vistas pasan la mayor
+# parte del tiempo esperando a la API, no usando CPU
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Importar la aplicación en el master antes del fork acelera el arranque
+preload_app = env_flag("GUNICORN_PRELOAD", "true")
+
+# Reciclar workers tras N requests (con jitter para no reiniciarlos a la vez)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Mayor que el keepalive_timeout de los upstreams de nginx (60s)
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "75"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Con preload_app la sesión HTTP se creó en el master: cada worker usa la suya
+    import app
+
+    app.api_session = app.create_api_session()